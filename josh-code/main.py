@@ -14,486 +14,585 @@ import utime
 import _thread
 import gc
 
-letters = {
-        'A': [
-            "  *  ",
-            " * * ",
-            "*   *",
-            "*****",
-            "*   *",
-            "*   *",
-            "*   *"
-        ],
-        'B': [
-            "**** ",
-            "*   *",
-            "*   *",
-            "**** ",
-            "*   *",
-            "*   *",
-            "**** "
-        ],
-        'C': [
-            " ****",
-            "*    ",
-            "*    ",
-            "*    ",
-            "*    ",
-            "*    ",
-            " ****"
-        ],
-        'D': [
-            "**** ",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "**** "
-        ],
-        'E': [
-            "*****",
-            "*    ",
-            "*    ",
-            "**** ",
-            "*    ",
-            "*    ",
-            "*****"
-        ],
-        'F': [
-            "*****",
-            "*    ",
-            "*    ",
-            "**** ",
-            "*    ",
-            "*    ",
-            "*    "
-        ],
-        'G': [
-            " ****",
-            "*    ",
-            "*    ",
-            "*  **",
-            "*   *",
-            "*   *",
-            " ****"
-        ],
-        'H': [
-            "*   *",
-            "*   *",
-            "*   *",
-            "*****",
-            "*   *",
-            "*   *",
-            "*   *"
-        ],
-        'I': [
-            "*****",
-            "  *  ",
-            "  *  ",
-            "  *  ",
-            "  *  ",
-            "  *  ",
-            "*****"
-        ],
-        'J': [
-            "*****",
-            "    *",
-            "    *",
-            "    *",
-            "    *",
-            "*   *",
-            " *** "
-        ],
-        'K': [
-            "*   *",
-            "*  * ",
-            "* *  ",
-            "**   ",
-            "* *  ",
-            "*  * ",
-            "*   *"
-        ],
-        'L': [
-            "*    ",
-            "*    ",
-            "*    ",
-            "*    ",
-            "*    ",
-            "*    ",
-            "*****"
-        ],
-        'M': [
-            "*   *",
-            "** **",
-            "* * *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *"
-        ],
-        'N': [
-            "*   *",
-            "**  *",
-            "* * *",
-            "*  **",
-            "*   *",
-            "*   *",
-            "*   *"
-        ],
-        'O': [
-            " *** ",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            " *** "
-        ],
-        'P': [
-            "**** ",
-            "*   *",
-            "*   *",
-            "**** ",
-            "*    ",
-            "*    ",
-            "*    "
-        ],
-        'Q': [
-            " *** ",
-            "*   *",
-            "*   *",
-            "*   *",
-            "* * *",
-            "*  * ",
-            " ** *"
-        ],
-        'R': [
-            "**** ",
-            "*   *",
-            "*   *",
-            "**** ",
-            "* *  ",
-            "*  * ",
-            "*   *"
-        ],
-        'S': [
-            " ****",
-            "*    ",
-            "*    ",
-            " *** ",
-            "    *",
-            "    *",
-            "**** "
-        ],
-        'T': [
-            "*****",
-            "  *  ",
-            "  *  ",
-            "  *  ",
-            "  *  ",
-            "  *  ",
-            "  *  "
-        ],
-        'U': [
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            " *** "
-        ],
-        'V': [
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            " * * ",
-            "  *  "
-        ],
-        'W': [
-            "*   *",
-            "*   *",
-            "*   *",
-            "*   *",
-            "* * *",
-            "** **",
-            "*   *"
-        ],
-        'X': [
-            "*   *",
-            "*   *",
-            " * * ",
-            "  *  ",
-            " * * ",
-            "*   *",
-            "*   *"
-        ],
-        'Y': [
-            "*   *",
-            "*   *",
-            " * * ",
-            "  *  ",
-            "  *  ",
-            "  *  ",
-            "  *  "
-        ],
-        'Z': [
-            "*****",
-            "    *",
-            "   * ",
-            "  *  ",
-            " *   ",
-            "*    ",
-            "*****"
-        ],
-        ' ': [
-            "     ",
-            "     ",
-            "     ",
-            "     ",
-            "     ",
-            "     ",
-            "     "
-        ]
-}
+# 5x7 font, five column bytes per glyph in font_glyphs order. Bit n of a
+# column byte is glyph row 6 - n, which is field x = n on the scroller.
+font_glyphs = "ABCDEFGHIJKLMNOPQRSTUVWXYZ "
+font_data = (
+    b"\x1f\x28\x48\x28\x1f" # A
+    b"\x7f\x49\x49\x49\x36" # B
+    b"\x3e\x41\x41\x41\x41" # C
+    b"\x7f\x41\x41\x41\x3e" # D
+    b"\x7f\x49\x49\x49\x41" # E
+    b"\x7f\x48\x48\x48\x40" # F
+    b"\x3e\x41\x41\x49\x4f" # G
+    b"\x7f\x08\x08\x08\x7f" # H
+    b"\x41\x41\x7f\x41\x41" # I
+    b"\x42\x41\x41\x41\x7e" # J
+    b"\x7f\x08\x14\x22\x41" # K
+    b"\x7f\x01\x01\x01\x01" # L
+    b"\x7f\x20\x10\x20\x7f" # M
+    b"\x7f\x20\x10\x08\x7f" # N
+    b"\x3e\x41\x41\x41\x3e" # O
+    b"\x7f\x48\x48\x48\x30" # P
+    b"\x3e\x41\x45\x42\x3d" # Q
+    b"\x7f\x48\x4c\x4a\x31" # R
+    b"\x31\x49\x49\x49\x46" # S
+    b"\x40\x40\x7f\x40\x40" # T
+    b"\x7e\x01\x01\x01\x7e" # U
+    b"\x7c\x02\x01\x02\x7c" # V
+    b"\x7f\x02\x04\x02\x7f" # W
+    b"\x63\x14\x08\x14\x63" # X
+    b"\x60\x10\x0f\x10\x60" # Y
+    b"\x43\x45\x49\x51\x61" # Z
+    b"\x00\x00\x00\x00\x00" # space
+)
+font_5x7 = (font_glyphs, font_data)
+marquee_cache = {} # (text, font) to column strip, see marquee_strip()
 
 def core1_thread():
     gc.collect()
     global flip, current_change, current_level
     while True:
         handle_events()
-        if flip == True:
-            render()
-            flip = False
+        frame_show()
         if current_change == True:
-            led_current(current_level)
-            current_change = False
+            # core 0 stages led_control and these flags under the same lock,
+            # so a change can neither land halfway through the push nor
+            # between the push and clearing current_change
+            with led_control_lock:
+                led_current(current_level)
+                current_change = False
+
+def font_column(font, letter, column):
+    glyph = font[0].find(letter)
+    if glyph < 0:
+        glyph = font[0].find(" ")
+    return font[1][(glyph * 5) + column]
+
+def marquee_strip(text, font):
+    # every column the scroller will show for text, each glyph followed by
+    # a blank column, built once per text and font and then reused
+    key = (text, font)
+    strip = marquee_cache.get(key)
+    if strip == None:
+        strip = bytearray(len(text) * 6)
+        for index in range(0, len(text)):
+            for column in range(0, 5):
+                strip[(index * 6) + column] = font_column(font, text[index], column)
+        marquee_cache[key] = strip
+    return strip
+
+def font_blit(dest, offset, bits):
+    # one font column onto the field row at dest[offset], bit n lights x = n
+    for x in range(0, 7):
+        if bits & (1 << x):
+            dest[offset + x] = 255
+        else:
+            dest[offset + x] = 0
+
+def scroll_push(bits):
+    global scroll_head
+    # the new bottom row goes over the old top row, then the head moves on
+    font_blit(scroll_view, scroll_head * field_width, bits)
+    scroll_head = scroll_head + 1
+    if scroll_head == field_height:
+        scroll_head = 0
+
+def frame_wait():
+    global frame_next, frame_overruns, step_budget, gc_collect_at, gc_collects, gc_last_alloc
+    if gc_stats == True:
+        gc_sample()
+    # sleep off whatever is left of this frame's period, measured from when
+    # the frame was due rather than from when the work finished
+    frame_next = utime.ticks_add(frame_next, frame_period_ms)
+    remaining = utime.ticks_diff(frame_next, utime.ticks_ms())
+    if remaining > gc_slack_ms and gc.mem_alloc() >= gc_collect_at:
+        # collect in the slack at the end of a frame, not in the middle of one
+        gc.collect()
+        gc_collects = gc_collects + 1
+        gc_last_alloc = gc.mem_alloc()
+        gc_collect_at = gc_last_alloc + gc_budget
+        remaining = utime.ticks_diff(frame_next, utime.ticks_ms())
+    if remaining > 0:
+        utime.sleep_ms(remaining)
+    else:
+        frame_overruns = frame_overruns + 1
+        if remaining <= -frame_period_ms:
+            # more than a whole frame late, start counting again from now
+            frame_next = utime.ticks_ms()
+    step_budget = step_catchup
+
+def gc_sample():
+    global gc_last_alloc, gc_frames
+    # heap growth since the last frame, both cores, added up per level
+    used = gc.mem_alloc()
+    if game_mode == 0:
+        slot = game_level + 3
+    else:
+        slot = len(gc_level_bytes) - 1
+    if used >= gc_last_alloc:
+        gc_level_bytes[slot] = gc_level_bytes[slot] + used - gc_last_alloc
+        gc_level_frames[slot] = gc_level_frames[slot] + 1
+    gc_frames = gc_frames + 1
+    if gc_frames >= gc_report_frames:
+        gc_frames = 0
+        for slot in range(0, len(gc_level_bytes)):
+            if gc_level_frames[slot] > 0:
+                if slot == len(gc_level_bytes) - 1:
+                    print("gc hud", gc_level_bytes[slot] // gc_level_frames[slot], "B/frame")
+                else:
+                    print("gc level", slot - 3, gc_level_bytes[slot] // gc_level_frames[slot], "B/frame")
+                gc_level_bytes[slot] = 0
+                gc_level_frames[slot] = 0
+        print("gc free", gc.mem_free(), "alloc", gc.mem_alloc(), "collections", gc_collects)
+    gc_last_alloc = gc.mem_alloc()
+
+def step_due():
+    global step_next, step_budget
+    # True once per step_period_ms of elapsed time, so the game runs at the
+    # same speed whatever the frame rate. At most step_catchup steps a frame.
+    if utime.ticks_diff(utime.ticks_ms(), step_next) < 0:
+        return False
+    if step_budget == 0:
+        step_next = utime.ticks_ms()
+        return False
+    step_budget = step_budget - 1
+    step_next = utime.ticks_add(step_next, step_period_ms)
+    return True
 
 def led_init():
     i2c.writeto_mem(0x3C, 0x4F, b'\x00')
     i2c.writeto_mem(0x3C, 0x00, b'\x01')
     i2c.writeto_mem(0x3F, 0x4F, b'\x00')
     i2c.writeto_mem(0x3F, 0x00, b'\x01')
-    for i in range(0,36):
-        i2c.writeto_mem(0x3C, 0x26 + i, b'\x07')
-        i2c.writeto_mem(0x3F, 0x26 + i, b'\x07')
+    led_control[0:36] = led_currents[0]
+    led_control[36:72] = led_currents[0]
+    led_scale_update()
+    i2c.writeto_mem(0x3C, 0x26, led_control_views[0])
+    i2c.writeto_mem(0x3F, 0x26, led_control_views[1])
     i2c.writeto_mem(0x3C, 0x25, b'\x00')
     i2c.writeto_mem(0x3F, 0x25, b'\x00')
-    
+
 def led_current(level):
-    if level == 0:
-        for i in range(0,36):
-            i2c.writeto_mem(0x3C, 0x26 + i, b'\x07')
-            i2c.writeto_mem(0x3F, 0x26 + i, b'\x07')
-    elif level == 1:
-        for i in range(0,36):
-            i2c.writeto_mem(0x3C, 0x26 + i, b'\x05')
-            i2c.writeto_mem(0x3F, 0x26 + i, b'\x05')
-    elif level == 2:
-        for i in range(0,36):
-            i2c.writeto_mem(0x3C, 0x26 + i, b'\x03')
-            i2c.writeto_mem(0x3F, 0x26 + i, b'\x03')
-    elif level == 3:
-        for i in range(0,36):
-            i2c.writeto_mem(0x3C, 0x26 + i, b'\x01')
-            i2c.writeto_mem(0x3F, 0x26 + i, b'\x01')
-    i2c.writeto_mem(0x3C, 0x25, b'\x00')
-    i2c.writeto_mem(0x3F, 0x25, b'\x00')
+    global frame_sent
+    # level -1 resends led_control as it is, after led_current_at() changes
+    if level >= 0 and level < len(led_currents):
+        led_control[0:36] = led_currents[level]
+        led_control[36:72] = led_currents[level]
+    led_scale_update()
+    # all 36 LED control registers in one auto-increment write per chip
+    i2c.writeto_mem(0x3C, 0x26, led_control_views[0])
+    i2c.writeto_mem(0x3F, 0x26, led_control_views[1])
+    # the new currents take effect on the next 0x25 write, make render()
+    # think the chips missed the latch byte so the next frame sends it. It
+    # sits below 0x26 and has to follow the control bytes, so it cannot
+    # share their write: a chip whose PWM data did not change next frame
+    # gets a one-byte latch write, an extra transaction on top of these two
+    frame_sent[35] = 1
+    frame_sent[71] = 1
+
+def led_current_at(x, y, level):
+    global current_level, current_change
+    # one LED's current, sent by core 1 along with any other pending changes
+    with led_control_lock:
+        led_control[led_control_slot[(y * field_width) + x]] = led_currents[level][0]
+        current_level = -1
+        current_change = True
+
+def led_scale_update():
+    # microamps per LED at full PWM, from the SL bits of each control register
+    for slot in range(0, 72):
+        control = led_control[slot]
+        if control & 1 == 0:
+            led_scale[slot] = 0
+        else:
+            led_scale[slot] = led_imax_ua // (((control >> 1) & 3) + 1)
+
+def power_estimate():
+    global power_estimate_ua
+    # average LED current of the frame being drawn, PWM is a duty cycle out of 256
+    total = 0
+    for node_index in range(0, array_size):
+        total = total + overscan[overscan_map[node_index]] * led_scale[led_control_slot[node_index]]
+    power_estimate_ua = total >> 8
+    return power_estimate_ua
+
+def power_limit():
+    global frames_power_limited
+    # scale the whole frame down to power_budget_ua, keeping its shape
+    if power_estimate() <= power_budget_ua:
+        return
+    scale = (power_budget_ua << 8) // power_estimate_ua
+    for node_index in range(0, array_size):
+        index = overscan_map[node_index]
+        overscan[index] = (overscan[index] * scale) >> 8
+    frames_power_limited = frames_power_limited + 1
+
+def frame_present():
+    global flip, frame_back, frame_front, frames_dropped, overscan
+    # core 0, once a frame is drawn. flip is only set here and only cleared
+    # by core 1, so whichever core owns a buffer is never in doubt.
+    if power_budget_ua > 0:
+        power_limit()
+    if flip == True:
+        # core 1 still has the last one, this frame gets drawn over
+        frames_dropped = frames_dropped + 1
+        return
+    frame_front = frame_back
+    frame_back = 1 - frame_back
+    overscan = overscan_buffers[frame_back]
+    flip = True
+
+def frame_show():
+    global flip, frames_repeated
+    # core 1, sends the front buffer if core 0 has handed over a new one
+    if flip == True:
+        render()
+        flip = False
+    else:
+        frames_repeated = frames_repeated + 1
 
 def render():
-    global buffer_60, buffer_63, overscan        
-    for i in range(0, 35):
-        buffer_60[i] = overscan[chip_60[i]]
-        buffer_63[i] = overscan[chip_63[i]]
-    i2c.writeto_mem(60, 2, buffer_60)
-    i2c.writeto_mem(63, 2, buffer_63)
-    i2c.writeto_mem(0x3C, 0x25, b'\x00')
-    i2c.writeto_mem(0x3F, 0x25, b'\x00')
+    global frames_sent, frames_skipped
+    buffer = frame_buffers[frame_front]
+    if fused_frame == False:
+        src = overscan_buffers[frame_front]
+        for i in range(0, 35):
+            buffer[i] = src[chip_60[i]]
+            buffer[36 + i] = src[chip_63[i]]
+    if buffer == frame_sent:
+        frames_skipped = frames_skipped + 1
+        return
+    render_push(0x3C, 0)
+    render_push(0x3F, 36)
+    frame_sent[:] = buffer
+    frames_sent = frames_sent + 1
+
+def render_push(address, base):
+    global render_bytes
+    buffer = frame_buffers[frame_front]
+    # PWM 0x02-0x24 and the 0x25 latch are one auto-increment run, so start
+    # at the first changed register and let the write run on through the latch
+    for i in range(base, base + 36):
+        if buffer[i] != frame_sent[i]:
+            break
+    else:
+        return
+    i2c.writeto_mem(address, 0x02 + i - base, frame_tails[frame_front][i])
+    render_bytes = render_bytes + base + 36 - i
+
+def gamma_select(table):
+    global gamma_lut
+    step = 256 // len(table)
+    for value in range(0, 256):
+        gamma_lut[value] = table[value // step]
+
+def overscan_setup(fused):
+    global fused_frame, overscan, overscan_buffers, overscan_map
+    fused_frame = fused
+    if fused == True:
+        # draw straight into the chip payloads, render() only has to transmit
+        overscan_buffers = frame_buffers
+        for i in range(0, 35):
+            overscan_map[chip_60[i]] = i
+            overscan_map[chip_63[i]] = 36 + i
+    else:
+        overscan_buffers = (bytearray(array_size), bytearray(array_size))
+        for i in range(0, array_size):
+            overscan_map[i] = i
+    overscan = overscan_buffers[frame_back]
 
 def overscan_fill(value):
-    global overscan
-    temp = int(value / 4)
+    global overscan, overscan_map
+    temp = gamma_lut[value]
     for i in range(0, array_size):
-        overscan[i] = gama_64[temp]
+        overscan[overscan_map[i]] = temp
 
 def overscan_set_at(x, y, value):
-    global overscan
-    temp = int(value / 4)
-    node_offset = get_node_offset(x, y)
-    overscan[node_offset] = gama_64[temp]
+    global overscan, overscan_map
+    overscan[overscan_map[(y * field_width) + x]] = gamma_lut[value]
+
+def overscan_blit(src):
+    global overscan, overscan_map
+    lut = gamma_lut
+    for i in range(0, array_size):
+        overscan[overscan_map[i]] = lut[src[i]]
+
+def overscan_blit_ring(src, start):
+    global overscan, overscan_map
+    # src is a ring of rows, the field's top row is at src[start]
+    lut = gamma_lut
+    split = array_size - start
+    for i in range(0, split):
+        overscan[overscan_map[i]] = lut[src[start + i]]
+    for i in range(split, array_size):
+        overscan[overscan_map[i]] = lut[src[i - split]]
 
 def draw():
+    global game_level
+    levels[game_level + 3][2]()
+
+def draw_node_value():
+    global node_value
+    overscan_blit(node_value)
+
+def draw_level_0():
     global button_x, button_y
     global node_value, node_deform, node_rendered, node_lock, node_counter
-    global game_level
     global field_width, field_height
-    if game_level == 0:
-        overscan_fill(0)
-        for y in range(0, field_height):
-            for x in range(0, field_width):
-                node_offset = get_node_offset(x, y)
-                button_offset = get_node_offset(button_x, button_y)
-                multiplier = int(node_counter[button_offset] / 4)
-                if multiplier == 0: multiplier = 1
-                temp_value = node_value[node_offset] - (node_deform[node_offset] * multiplier)
-                if temp_value < 0: temp_value = 0
-                node_rendered[node_offset] = temp_value
-                if node_lock[node_offset] == 0:
-                    overscan_set_at(x, y, temp_value)
-                else:
-                    overscan_set_at(x, y, 0)
-    if game_level == 1 or game_level == 2 or game_level == 3 or game_level == 7 or game_level == 8 or game_level == 9 or game_level == 10 or game_level == 11 or game_level == 12 or game_level == 13 or game_level == 14:
-        overscan_fill(0)
-        for y in range(0, field_height):
-            for x in range(0, field_width):
-                node_offset = get_node_offset(x, y)
-                temp_value = node_value[node_offset]
-                overscan_set_at(x, y, temp_value)
-    if game_level == 4:
-        overscan_fill(0)
-        for y in range(0, field_height):
-            for x in range(0, field_width):
-                node_offset = get_node_offset(x, y)
-                temp_value = node_value[node_offset]
+    overscan_fill(0)
+    for y in range(0, field_height):
+        for x in range(0, field_width):
+            node_offset = get_node_offset(x, y)
+            button_offset = get_node_offset(button_x, button_y)
+            multiplier = node_counter[button_offset] // 4
+            if multiplier == 0: multiplier = 1
+            temp_value = node_value[node_offset] - (node_deform[node_offset] * multiplier)
+            if temp_value < 0: temp_value = 0
+            node_rendered[node_offset] = temp_value
+            if node_lock[node_offset] == 0:
                 overscan_set_at(x, y, temp_value)
-    if game_level == 5:
-        overscan_fill(0)
-        for index in range(0, field_width):
-            if node_counter[index] == 1:
-                x, y = get_node_coords(node_deform[index])
-                overscan_set_at(x, y, 255)
-            if node_counter[index] == 2:
-                x, y = get_node_coords(node_deform[index])
-                overscan_set_at(x, y, 128)
-    if game_level == 6:
-        overscan_fill(0)
+            else:
+                overscan_set_at(x, y, 0)
+
+def draw_level_5():
+    global node_counter, node_deform, field_width
+    overscan_fill(0)
+    for index in range(0, field_width):
+        if node_counter[index] == 1:
+            x = node_x[node_deform[index]]
+            y = node_y[node_deform[index]]
+            overscan_set_at(x, y, 255)
+        if node_counter[index] == 2:
+            x = node_x[node_deform[index]]
+            y = node_y[node_deform[index]]
+            overscan_set_at(x, y, 128)
+
+def draw_level_9():
+    global overscan, overscan_map
+    # segment i of the snake is drawn at 150 - 2i, with i counted from the
+    # ring slot in node_value so a move only touches the head and the tail
+    lut = gamma_lut
+    ramp = level_9_ramp
+    dark = lut[0]
+    offset = head_level_9 + array_size + 1
+    for i in range(0, array_size):
+        slot = node_value[i]
+        if slot == 0:
+            overscan[overscan_map[i]] = dark
+        else:
+            overscan[overscan_map[i]] = lut[ramp[offset - slot]]
+    if node_counter[1] < array_size:
+        overscan_set_at(node_x[node_counter[1]], node_y[node_counter[1]], 255)
+
+def draw_level_6():
+    global node_value, field_width, field_height
+    overscan_blit(node_value)
+    for x in range(0, field_width):
         for y in range(0, field_height):
-            for x in range(0, field_width):
-                node_offset = get_node_offset(x, y)
-                temp_value = node_value[node_offset]
-                overscan_set_at(x, y, temp_value)
-        for x in range(0, field_width):
-            for y in range(0, field_height):
-                node_offset = get_node_offset(x, y)
-                temp_value = node_value[node_offset]
-                if temp_value == 255:
-                    temp_delta = 2
-                    for yo in range(0, 8):
-                        temp_tamp = int(256 / temp_delta)
-                        if temp_tamp < 14: temp_tamp = 0
-                        temp_delta = temp_delta + 4
-                        target_y = y - yo - 1
-                        if target_y < 0:
-                            target_y = target_y + field_height
-                        overscan_set_at(x, target_y, temp_tamp)
+            node_offset = get_node_offset(x, y)
+            temp_value = node_value[node_offset]
+            if temp_value == 255:
+                temp_delta = 2
+                for yo in range(0, 8):
+                    temp_tamp = 256 // temp_delta
+                    if temp_tamp < 14: temp_tamp = 0
+                    temp_delta = temp_delta + 4
+                    target_y = y - yo - 1
+                    if target_y < 0:
+                        target_y = target_y + field_height
+                    overscan_set_at(x, target_y, temp_tamp)
+
+@rp2.asm_pio(out_init=(rp2.PIO.IN_LOW,) * 21, out_shiftdir=rp2.PIO.SHIFT_RIGHT, in_shiftdir=rp2.PIO.SHIFT_LEFT, autopush=True, push_thresh=24, fifo_join=rp2.PIO.JOIN_RX)
+def key_scan_program():
+    # out pins are GPIO 2-22 and in pins GPIO 5-28, key_scan_start() leaves
+    # the PIO owning only the seven row pins in that window. Y holds a single bit that
+    # gets shifted onto each row in turn, that row's pindir goes to output and
+    # pulls it low (out values stay low), every other row floats on its pull-up.
+    # One 24-bit column sample per row lands in the RX FIFO, row1 first.
+    # JOIN_RX leaves no TX FIFO, so Y = 1 << 20 is built in the ISR instead
+    # of pulled, then the ISR is cleared so autopush counts from 0.
+    # That brings the program to the full 32 instructions.
+    set(y, 1)
+    mov(isr, y)
+    in_(null, 20)
+    mov(y, isr)
+    mov(isr, null)
+    wrap_target()
+    mov(osr, y)
+    out(null, 20)
+    out(pindirs, 21)    [31] # row1, GPIO 2
+    in_(pins, 24)
+    mov(osr, y)
+    out(null, 19)
+    out(pindirs, 21)    [31] # row2, GPIO 3
+    in_(pins, 24)
+    mov(osr, y)
+    out(null, 18)
+    out(pindirs, 21)    [31] # row3, GPIO 4
+    in_(pins, 24)
+    mov(osr, y)
+    out(pindirs, 21)    [31] # row4, GPIO 22
+    in_(pins, 24)
+    mov(osr, y)
+    out(null, 10)
+    out(pindirs, 21)    [31] # row5, GPIO 12
+    in_(pins, 24)
+    mov(osr, y)
+    out(null, 9)
+    out(pindirs, 21)    [31] # row6, GPIO 13
+    in_(pins, 24)
+    mov(osr, y)
+    out(null, 8)
+    out(pindirs, 21)    [31] # row7, GPIO 14
+    in_(pins, 24)
+    wrap()
+
+def key_scan_start():
+    global key_sm, key_sm_row, pio_scan
+    for pin in row_pins:
+        pin.init(machine.Pin.IN, machine.Pin.PULL_UP)
+    key_sm = rp2.StateMachine(0, key_scan_program, freq=1000000, out_base=row1, in_base=col10)
+    # out_init hands GPIO 2-22 to the PIO, the window has to be that wide to
+    # reach every row. Take the rest back so the PIO owns rows 2-4, 12-14 and
+    # 22 only: columns 5-11 go back to the inputs they were at boot, the
+    # unused 15-21 to inputs with the pull-down they come out of reset with
+    for gpio in range(5, 12):
+        machine.Pin(gpio, machine.Pin.IN)
+    for gpio in range(15, 22):
+        machine.Pin(gpio, machine.Pin.IN, machine.Pin.PULL_DOWN)
+    key_sm_row = 0
+    key_sm.active(1)
+    pio_scan = True
 
 def handle_events():
+    global key_sm_row
+    if pio_scan == True:
+        # only take what is already queued, the SM keeps refilling behind us
+        for i in range(0, key_sm.rx_fifo()):
+            # columns read active low, GPIO 5-11 sit in bits 0-6 and GPIO 26-28 in bits 21-23
+            word = ~key_sm.get()
+            key_scan_row(key_sm_row, pio_cols_low[word & 0x7F] | pio_cols_high[(word >> 21) & 0x07])
+            key_sm_row = key_sm_row + 1
+            if key_sm_row == 7:
+                key_sm_row = 0
+        return
     for x in range(0, 7):
         utime.sleep(bounceDelay)
-        if x == 0:
-            row7.value(1)
-            row1.value(0)
-        elif x == 1:
-            row1.value(1)
-            row2.value(0)
-        elif x == 2:
-            row2.value(1)
-            row3.value(0)
-        elif x == 3:
-            row3.value(1)
-            row4.value(0)
-        elif x == 4:
-            row4.value(1)
-            row5.value(0)
-        elif x == 5:
-            row5.value(1)
-            row6.value(0)
-        elif x == 6:
-            row6.value(1)
-            row7.value(0)
-        if(col1.value() == 0):
-            coreXfer_buttonStates[x][0] = 1
-        else:
-            coreXfer_buttonStates[x][0] = 0
-        if(col2.value() == 0):
-            coreXfer_buttonStates[x][1] = 1
-        else:
-            coreXfer_buttonStates[x][1] = 0
-        if(col3.value() == 0):
-            coreXfer_buttonStates[x][2] = 1
-        else:
-            coreXfer_buttonStates[x][2] = 0
-        if(col4.value() == 0):
-            coreXfer_buttonStates[x][3] = 1
-        else:
-            coreXfer_buttonStates[x][3] = 0
-        if(col5.value() == 0):
-            coreXfer_buttonStates[x][4] = 1
-        else:
-            coreXfer_buttonStates[x][4] = 0
-        if(col6.value() == 0):
-            coreXfer_buttonStates[x][5] = 1
-        else:
-            coreXfer_buttonStates[x][5] = 0
-        if(col7.value() == 0):
-            coreXfer_buttonStates[x][6] = 1
-        else:
-            coreXfer_buttonStates[x][6] = 0
-        if(col8.value() == 0):
-            coreXfer_buttonStates[x][7] = 1
-        else:
-            coreXfer_buttonStates[x][7] = 0
-        if(col9.value() == 0):
-            coreXfer_buttonStates[x][8] = 1
-        else:
-            coreXfer_buttonStates[x][8] = 0
-        if(col10.value() == 0):
-            coreXfer_buttonStates[x][9] = 1
-        else:
-            coreXfer_buttonStates[x][9] = 0
-    get_button_states()
-    
-def get_button_states():
-    global button_x, button_y, coreXfer_buttonStates_old
-    for i in range(0, array_size):
-        x, y = get_node_coords(i)
-        if coreXfer_buttonStates[x][y] != coreXfer_buttonStates_old[x][y]:
-            coreXfer_buttonStates_old[x][y] = coreXfer_buttonStates[x][y]
-            
-            if coreXfer_buttonStates[x][y] != node_switch_state[i]:
+        row_pins[x - 1].value(1)
+        row_pins[x].value(0)
+        mask = 0
+        bit = 1
+        for pin in col_pins:
+            if pin.value() == 0:
+                mask = mask | bit
+            bit = bit << 1
+        if mask != row_masks[x]:
+            key_scan_row(x, mask)
+
+def key_scan_row(x, mask):
+    global button_x, button_y
+    changed = mask ^ row_masks[x]
+    row_masks[x] = mask
+    y = 0
+    while changed != 0:
+        if changed & 1:
+            state = (mask >> y) & 1
+            if state != node_switch_state[(y * field_width) + x]:
                 button_x = x
                 button_y = y
-                if coreXfer_buttonStates[button_x][button_y] == 0:
-                    left_click_up_event(button_x, button_y)
+                if state == 0:
+                    left_click_up_event(x, y)
                 else:
-                    left_click_down_event(button_x, button_y)
+                    left_click_down_event(x, y)
+        changed = changed >> 1
+        y = y + 1
 
 def left_click_down_event(x, y):
     global node_switch_state
-    node_switch_state[get_node_offset(x, y)] = 1
+    node_switch_set(get_node_offset(x, y), 1)
     if get_node_offset(x, y) == 0:
         global hud_pressed
         hud_pressed = 1
 
 def left_click_up_event(x, y):
     global node_switch_state
-    node_switch_state[get_node_offset(x, y)] = 0
+    node_switch_set(get_node_offset(x, y), 0)
     if get_node_offset(x, y) == 0:
         global hud_pressed
         hud_pressed = 0
 
+def node_switch_set(index, value):
+    global node_switch_mask
+    # node_switch_state plus the same presses packed per row, bit x of
+    # node_switch_rows[y], and node_switch_mask with bit x set for every
+    # column holding a press. Core 1 sets and clears from the key scan while
+    # core 0 clears the presses it consumes, so the read-modify-write of the
+    # masks happens under node_switch_lock
+    x = node_x[index]
+    y = node_y[index]
+    with node_switch_lock:
+        node_switch_state[index] = value
+        if value == 0:
+            node_switch_rows[y] = node_switch_rows[y] & ~(1 << x)
+            mask = 0
+            for y in range(0, field_height):
+                mask = mask | node_switch_rows[y]
+            node_switch_mask = mask
+        else:
+            node_switch_rows[y] = node_switch_rows[y] | (1 << x)
+            node_switch_mask = node_switch_mask | (1 << x)
+
+def node_switch_next(index):
+    # first pressed node at or after index in node order, array_size if none,
+    # so walking the presses costs a row check per row instead of a node scan
+    x = node_x[index]
+    y = node_y[index]
+    # under the lock so the node returned is one node_switch_state holds
+    with node_switch_lock:
+        while y < field_height:
+            bits = node_switch_rows[y] >> x
+            if bits != 0:
+                return y * field_width + x + bit_lowest[bits]
+            x = 0
+            y = y + 1
+    return array_size
+
+def node_set(index, value):
+    global node_lit
+    # node_value write that keeps node_lit, the count of non-zero nodes
+    if node_value[index] == 0:
+        if value != 0: node_lit = node_lit + 1
+    elif value == 0:
+        node_lit = node_lit - 1
+    node_value[index] = value
+
 def get_node_offset(x, y):
     global field_width
     return (y * field_width) + x
 
-def get_node_coords(index):
-    global field_width
-    y = int(index / field_width)
-    x = index - (y * field_width)
-    return x, y
+def node_neighbour_table(offsets, wrap):
+    # per node, the offsets of the nodes at (x + dx, y + dy) for each (dx, dy)
+    # in offsets, either wrapped around the field edges or left out past them
+    table = []
+    for node_index in range(0, array_size):
+        near = bytearray()
+        for dx, dy in offsets:
+            x = node_x[node_index] + dx
+            y = node_y[node_index] + dy
+            if wrap == True:
+                near.append(get_node_offset(x % field_width, y % field_height))
+            elif x >= 0 and x < field_width and y >= 0 and y < field_height:
+                near.append(get_node_offset(x, y))
+        table.append(bytes(near))
+    return tuple(table)
+
+def field_add(buffer, delta):
+    # saturating add over a whole field, no compares, field_clamp does the clipping
+    clamp = field_clamp
+    offset = delta + 255
+    for index in range(0, len(buffer)):
+        buffer[index] = clamp[buffer[index] + offset]
 
 def randrange(zero, modulo):
     global ant_random
@@ -501,210 +600,176 @@ def randrange(zero, modulo):
     if modulo == 0: modulo = 1
     return ant_random % modulo
 
+def randrange_fill(buffer, modulo, count=0):
+    global ant_random, random_pool, random_bits
+    if count == 0: count = len(buffer)
+    if modulo < 2:
+        for index in range(0, count):
+            buffer[index] = 0
+        return buffer
+    bits = 1
+    while (1 << bits) < modulo:
+        bits = bits + 1
+    mask = (1 << bits) - 1
+    pool = random_pool
+    pool_bits = random_bits
+    index = 0
+    while index < count:
+        if pool_bits < bits:
+            # 8 fresh bits per ant step, only as many steps as the draws need
+            step_level_minus_3()
+            pool = pool | ((ant_random & 0xFF) << pool_bits)
+            pool_bits = pool_bits + 8
+        value = pool & mask
+        pool = pool >> bits
+        pool_bits = pool_bits - bits
+        if value < modulo:
+            buffer[index] = value
+            index = index + 1
+    random_pool = pool
+    random_bits = pool_bits
+    return buffer
+
 def level_init(level):
-    global node_counter, node_switch_state, node_lock, node_velocity, node_value, node_deform
+    global node_counter, node_switch_state, node_lock, node_velocity, node_value, node_deform, node_switch_mask, node_lit
     global button_x, button_y
     global game_level, array_size, game_timeout
-    global field_width, field_height
-    for node_index in range(0, array_size):
-        node_counter[node_index] = 0
-        node_switch_state[node_index] = 0
-        node_lock[node_index] = 0
-        node_velocity[node_index] = 0
-        node_value[node_index] = 0
-        node_deform[node_index] = 0
+    node_counter[:] = node_blank
+    with node_switch_lock:
+        node_switch_state[:] = node_blank
+        node_switch_rows[:] = row_blank
+        node_switch_mask = 0
+    node_lock[:] = node_blank
+    node_velocity[:] = node_blank
+    node_value[:] = node_blank
+    node_lit = 0
+    node_deform[:] = node_blank
     button_x = 0
     button_y = 0
     game_timeout = 0
-    if level == -3:
-        global ant_rotation, ant_position
-        ant_position = (7 * 5) + 4
-        ant_rotation = 0
-    if level == 0:
-        for node_index in range(0, array_size):
-            node_value[node_index] = 0
-            node_velocity[node_index] = 128 # 0 right, 1 down, 2 left, 3 up
-    if level == 1:
-        global sub_level_1, column_level_1, left_level_1, right_level_1
-        sub_level_1 = 0
-        column_level_1 = 0
-        left_level_1 = 0
-        right_level_1 = 0
-    if level == 2:
-        global node_level_2
-        node_level_2 = array_size
-        for node_index in range(0, array_size):
-            node_value[node_index] = 64
-    if level == 3:
-        global node_1_level_3, node_2_level_3, node_3_level_3, node_4_level_3
-        node_1_level_3 = array_size
-        node_2_level_3 = array_size
-        node_3_level_3 = array_size
-        node_4_level_3 = array_size
-    if level == 4:
-        for node_index in range(0, array_size):
-            node_counter[node_index] = 7
-            node_velocity[node_index] = 1
-    if level == 5:
-        global started_level_5
-        started_level_5 = 0
-    if level == 6:
-        for xo in range(0, field_width):
-            yo = randrange(0, field_height)
-            node_value[get_node_offset(xo, yo)] = 255
-    if level == 7:
-        node_counter[0] = 128
-        for node_index in range(0, 6):
-            node_lock[node_index] = randrange(0, array_size)
-            node_value[node_lock[node_index]] = 128
-    if level == 8:
-        yo = 0
-        for xo in range(0, field_width):
-            node_counter[get_node_offset(xo, yo)] = 1
-    if level == 9:
-        for node_index in range(0, array_size):
-            node_deform[node_index] = array_size
-        node_deform[0] = randrange(0, array_size)
-        node_counter[0] = array_size - 1
-        node_counter[1] = array_size
-    if level == 10:
-        pass
-    if level == 11:
-        for node_index in range(0, array_size):
-            temp_random = randrange(0, 4)
-            if temp_random == 0:
-                node_velocity[node_index] = 8
-            elif temp_random == 1:
-                node_velocity[node_index] = 6
-            elif temp_random == 2:
-                node_velocity[node_index] = 2
-            elif temp_random == 3:
-                node_velocity[node_index] = 4
-            node_counter[node_index] = node_index
-            node_value[node_index] = 8
-    if level == 12:
-        node_deform[0] = randrange(0, array_size)
-        node_deform[1] = 64
-        node_deform[2] = 128
-    if level == 13:
-        node_index = 0
-        node_deform[node_index] = randrange(0, array_size)
-        for node_index in range(1, array_size):
-            finished = False
-            while finished == False:
-                temp_value = randrange(0, array_size)
-                check = True
-                for node_offset in range(0, node_index):
-                    if node_deform[node_offset] == temp_value:
-                        check = False
-                if check == True:
-                    node_deform[node_index] = temp_value
-                    finished = True
-        node_velocity[0] = 0
+    levels[level + 3][0]()
     game_level = level
 
+def level_idle():
+    pass
+
+def init_level_minus_3():
+    global ant_rotation, ant_position
+    ant_position = (7 * 5) + 4
+    ant_rotation = 0
+
+def init_level_0():
+    global node_value, node_velocity, array_size
+    # node_value is already clear from level_init()
+    node_velocity[:] = level_0_velocity # 0 right, 1 down, 2 left, 3 up
+
+def init_level_1():
+    global sub_level_1, column_level_1, left_level_1, right_level_1
+    sub_level_1 = 0
+    column_level_1 = 0
+    left_level_1 = 0
+    right_level_1 = 0
+
+def init_level_2():
+    global node_level_2, node_value, array_size, node_lit
+    node_level_2 = array_size
+    node_value[:] = level_2_value
+    node_lit = array_size
+
+def init_level_3():
+    global node_1_level_3, node_2_level_3, node_3_level_3, node_4_level_3
+    node_1_level_3 = array_size
+    node_2_level_3 = array_size
+    node_3_level_3 = array_size
+    node_4_level_3 = array_size
+
+def init_level_4():
+    global node_counter, node_velocity, array_size
+    node_counter[:] = level_4_counter
+    node_velocity[:] = level_4_velocity
+
+def init_level_5():
+    global started_level_5
+    started_level_5 = 0
+
+def init_level_6():
+    global node_value, field_width, field_height
+    randrange_fill(random_buffer, field_height, field_width)
+    for xo in range(0, field_width):
+        node_value[get_node_offset(xo, random_buffer[xo])] = 255
+
+def init_level_7():
+    global node_counter, node_lock, node_value, array_size, locks_level_7
+    node_counter[0] = 128
+    randrange_fill(random_buffer, array_size, 6)
+    for node_index in range(0, 6):
+        node_lock[node_index] = random_buffer[node_index]
+        node_set(node_lock[node_index], 128)
+    locks_level_7 = node_lit
+
+def init_level_8():
+    global node_counter, field_width
+    # the top row
+    node_counter[0:field_width] = level_8_counter
+
+def init_level_9():
+    global node_deform, node_counter, array_size, head_level_9
+    node_deform[:] = level_9_deform
+    head_level_9 = 0
+    node_deform[0] = randrange(0, array_size)
+    node_lock[node_deform[0]] = 1
+    node_value[node_deform[0]] = 1
+    node_counter[0] = array_size - 1
+    node_counter[1] = array_size
+
+def snake_drop(index):
+    # node_deform slot index leaves the drawn body, node_lock counts the
+    # drawn segments on each node so a crossing keeps its newer segment
+    node_offset = node_deform[index]
+    if node_offset < array_size:
+        node_lock[node_offset] = node_lock[node_offset] - 1
+        if node_lock[node_offset] == 0:
+            node_value[node_offset] = 0
+
+def init_level_11():
+    global node_velocity, node_counter, node_value, array_size
+    randrange_fill(random_buffer, 4)
+    for node_index in range(0, array_size):
+        node_velocity[node_index] = level_11_velocity[random_buffer[node_index]]
+    node_counter[:] = level_11_counter
+    node_value[:] = level_11_value
+
+def init_level_12():
+    global node_deform, array_size
+    node_deform[0] = randrange(0, array_size)
+    node_deform[1] = 64
+    node_deform[2] = 128
+
+def init_level_13():
+    global node_deform, node_velocity, array_size
+    node_index = 0
+    node_deform[node_index] = randrange(0, array_size)
+    for node_index in range(1, array_size):
+        finished = False
+        while finished == False:
+            temp_value = randrange(0, array_size)
+            check = True
+            for node_offset in range(0, node_index):
+                if node_deform[node_offset] == temp_value:
+                    check = False
+            if check == True:
+                node_deform[node_index] = temp_value
+                finished = True
+    node_velocity[0] = 0
+
 def step():
     global game_level
-    if game_level == -3:
-        step_level_minus_3()
-        return
-    if game_level == 0:
-        step_level_0()
-        return
-    if game_level == 1:
-        if game_timeout_check() == True:
-            level_init(0)
-            return
-        else:
-            step_level_1()
-            return
-    if game_level == 2:
-        if game_timeout_check() == True:
-            level_init(1)
-            return
-        else:
-            step_level_2()
-            return
-    if game_level == 3:
-        if game_timeout_check() == True:
-            level_init(2)
-            return
-        else:
-            step_level_3()
-            return
-    if game_level == 4:
-        if game_timeout_check() == True:
-            level_init(3)
-            return
-        else:
-            step_level_4()
-            return
-    if game_level == 5:
-        if game_timeout_check() == True:
-            level_init(4)
-            return
-        else:
-            step_level_5()
-            return
-    if game_level == 6:
+    level = levels[game_level + 3]
+    if level[3] != None:
         if game_timeout_check() == True:
-            level_init(5)
+            level_init(level[3])
             return
-        else:
-            step_level_6()
-            return
-    if game_level == 7:
-        if game_timeout_check() == True:
-            level_init(6)
-            return
-        else:
-            step_level_7()
-            return    
-    if game_level == 8:
-        if game_timeout_check() == True:
-            level_init(7)
-            return
-        else:
-            step_level_8()
-            return
-    if game_level == 9:
-        if game_timeout_check() == True:
-            level_init(8)
-            return
-        else:
-            step_level_9()
-            return
-    if game_level == 10:
-        if game_timeout_check() == True:
-            level_init(9)
-            return
-        else:
-            step_level_10()
-            return    
-    if game_level == 11:
-        if game_timeout_check() == True:
-            level_init(10)
-            return
-        else:
-            step_level_11()
-            return
-    if game_level == 12:
-        if game_timeout_check() == True:
-            level_init(11)
-            return
-        else:
-            step_level_12()
-            return
-    if game_level == 13:
-        if game_timeout_check() == True:
-            level_init(12)
-            return
-        else:
-            step_level_13()
-            return
-    if game_level == 14:
-        step_level_14()
-        return
+    level[1]()
 
 def game_timeout_check():
     global game_level, game_timeout, game_timed
@@ -716,19 +781,23 @@ def game_timeout_check():
             return False
 
 def step_level_minus_3():
-    global ant_position, ant_rotation, ant_count, ant_random, ant_value
+    global ant_position, ant_rotation, ant_count, ant_random, ant_value, ant_sum
     global node_value, field_width, field_height, array_size
     rotation = ant_rotation
+    x = node_x[ant_position]
+    y = node_y[ant_position]
     if ant_value[ant_position] == 255:
         ant_value[ant_position] = 0
+        ant_sum = ant_sum - (1 << x)
         rotation = rotation + 1
         if rotation > 3: rotation = 0
     if ant_value[ant_rotation] == 0:
+        if ant_value[ant_position] != 255:
+            ant_sum = ant_sum + (1 << x)
         ant_value[ant_position] = 255
         rotation = rotation - 1
         if rotation < 0: rotation = 3
     ant_rotation = rotation
-    x, y = get_node_coords(ant_position)
     if ant_rotation == 0: x = x + 1
     if ant_rotation == 1: y = y + 1
     if ant_rotation == 2: x = x - 1
@@ -743,22 +812,9 @@ def step_level_minus_3():
     if x < 0: x = field_width - 1
     ant_position = get_node_offset(x, y)
     ant_count = ant_count + 1
-    last_random = ant_random
-    ant_random = 0
-    temp_random = [0] * field_height
-    for yo in range(0, field_height):
-        temp_value = 0
-        for xo in range(0, field_width):
-            if ant_value[get_node_offset(xo, yo)] == 255:
-                temp_value = temp_value + (1 << xo)
-        temp_random[yo] = temp_value
-    for yo in range(0, field_height):
-        ant_random = ant_random + temp_random[yo]
-    for yo in range(0, field_height):
-        ant_random = ant_random + (temp_random[yo] << (ant_count % 8))
-    ant_random = ant_random ^ ant_count
-    if last_random > 0:
-        ant_random = ant_random ^ last_random
+    # ant_sum is the sum of the per-row masks of set cells, kept up to date
+    # as cells flip instead of rebuilding it from the whole field
+    ant_random = (ant_sum + (ant_sum << (ant_count % 8))) ^ ant_count ^ ant_random
 
 def step_level_0():
     global node_value, node_velocity, node_deform, node_lock, array_size
@@ -771,62 +827,31 @@ def step_level_0():
     if pressed == True:
         if node_deform[0] < 255:
             node_deform[0] = node_deform[0] + 1
-        if node_deform[0] > 0:
-            finished = True
-            for node_index in range(0, array_size):
-                if node_value[node_index] > 0:
-                    finished = False
-                    temp_value = node_value[node_index]
-                    temp_value = temp_value - node_deform[0]
-                    if temp_value < 0:
-                        temp_value = 0
-                    node_value[node_index] = temp_value
-        if finished == True:
+        if node_value == node_blank:
             level_init(1)
+        else:
+            field_add(node_value, -node_deform[0])
     else:
         if node_deform[0] > 0:
             node_deform[0] = node_deform[0] - 1
         if node_value[0] > 127:
-            for node_index in range(0, array_size):
-                temp_value = node_value[node_index]
-                temp_value = temp_value + 32
-                if temp_value > 255:
-                    temp_value = 255
-                node_value[node_index] = temp_value
-        elif node_value[0] < 128:
-            for node_index in range(0, array_size):
-                temp_value = node_value[node_index]
-                temp_value = temp_value - 32
-                if temp_value < 0:
-                    temp_value = 0
-                node_value[node_index] = temp_value
+            field_add(node_value, 32)
+        else:
+            field_add(node_value, -32)
+        clamp = field_clamp
+        jitter = level_0_jitter
+        randrange_fill(random_buffer, 3)
         for node_index in range(0, array_size):
-            temp_value = node_velocity[node_index]
-            temp_random = randrange(0, 3)
-            if temp_random == 0:
-                temp_value = temp_value + 1
-            elif temp_random == 1:
-                temp_value = temp_value - 1
-            else:
-                pass
-            if temp_value > 130:
-                temp_value = 130
-            if temp_value < 125:
-                temp_value = 125
+            # velocity drifts by +1, -1 or 0 within 125-130, see level_0_jitter
+            temp_value = jitter[((node_velocity[node_index] - 125) << 2) | random_buffer[node_index]]
             node_velocity[node_index] = temp_value
-            temp_value = node_value[node_index]
-            if node_velocity[node_index] > 127:
+            if temp_value > 127:
                 if node_lock[node_index] == 0:
-                    temp_value = temp_value + 64
+                    node_value[node_index] = clamp[node_value[node_index] + (255 + 64)]
                 else:
                     node_lock[node_index] = node_lock[node_index] - 1
             else:
-                temp_value = temp_value - 64
-            if temp_value > 255:
-                temp_value = 255
-            if temp_value < 0:
-                temp_value = 0
-            node_value[node_index] = temp_value
+                node_value[node_index] = clamp[node_value[node_index] + (255 - 64)]
 
 def step_level_1():
     global game_timeout
@@ -834,6 +859,8 @@ def step_level_1():
     global array_size
     global field_width, field_height
     if sub_level_1 == 0:
+        if node_switch_mask == 0:
+            return
         for node_index in range(0, array_size):
             if node_switch_state[node_index] == 1:
                 game_timeout = 0
@@ -857,16 +884,12 @@ def step_level_1():
         if column_level_1 == (field_width - 1) or column_level_1 == 0: return
         left_level_1 = 0
         right_level_1 = 0
-        for xo in range(0, column_level_1):
-            for yo in range(0, field_height):
-                if node_switch_state[get_node_offset(xo, yo)] == 1: # press in left area
-                    game_timeout = 0
-                    left_level_1 = 1
-        for xo in range(column_level_1 + 1, field_width):
-            for yo in range(0, field_height):
-                if node_switch_state[get_node_offset(xo, yo)] == 1: # press in right area
-                    game_timeout = 0
-                    right_level_1 = 1
+        if node_switch_mask & level_1_left[column_level_1] != 0: # press in left area
+            game_timeout = 0
+            left_level_1 = 1
+        if node_switch_mask & level_1_right[column_level_1] != 0: # press in right area
+            game_timeout = 0
+            right_level_1 = 1
         fill_level_1()
         if left_level_1 == 1 and right_level_1 == 1: # switch to next level
             level_init(2)
@@ -876,36 +899,25 @@ def fill_level_1():
     global node_value, column_level_1, left_level_1, right_level_1
     global field_width, field_height
     if column_level_1 == (field_width - 1) or column_level_1 == 0: return
+    # each row is left area, the column, right area, so two slice copies a row
     if left_level_1 == 1:
-        for xo in range(0, column_level_1):
-            for yo in range(0, field_height):
-                node_index = get_node_offset(xo, yo)
-                node_value[node_index] = 255
+        left = level_1_on[column_level_1]
     else:
-        for xo in range(0, column_level_1):
-            for yo in range(0, field_height):
-                node_index = get_node_offset(xo, yo)
-                node_value[node_index] = 0
+        left = level_1_off[column_level_1]
     if right_level_1 == 1:
-        for xo in range(column_level_1 + 1, field_width):
-            for yo in range(0, field_height):
-                node_index = get_node_offset(xo, yo)
-                node_value[node_index] = 255
+        right = level_1_on[field_width - 1 - column_level_1]
     else:
-        for xo in range(column_level_1 + 1, field_width):
-            for yo in range(0, field_height):
-                node_index = get_node_offset(xo, yo)
-                node_value[node_index] = 0
+        right = level_1_off[field_width - 1 - column_level_1]
+    for yo in range(0, field_height):
+        row = yo * field_width
+        node_value[row:row + column_level_1] = left
+        node_value[row + column_level_1 + 1:row + field_width] = right
 
 def step_level_2():
     global game_timeout
     global node_level_2, node_value, node_velocity, node_switch_state
     global array_size
-    finished = True
-    for node_index in range(0, array_size):
-        if node_value[node_index] > 0:
-            finished = False
-    if finished == True:
+    if node_lit == 0:
         level_init(3)
         return
     if node_level_2 == array_size:
@@ -916,14 +928,14 @@ def step_level_2():
     else:
         if node_value[node_level_2] == 64:
             node_velocity[node_level_2] = 131
-            node_value[node_level_2] = 65
+            node_set(node_level_2, 65)
             return
         if node_value[node_level_2] == 255:
             node_velocity[node_level_2] = 125
-            node_value[node_level_2] = 254
+            node_set(node_level_2, 254)
             return
         if node_velocity[node_level_2] == 125 and node_value[node_level_2] == 65:
-            node_value[node_level_2] = 64
+            node_set(node_level_2, 64)
             node_level_2 = array_size
             return
         temp_velocity = node_velocity[node_level_2] - 128
@@ -931,11 +943,11 @@ def step_level_2():
         temp_value = temp_value + temp_velocity
         if temp_value < 64: temp_value = 64
         if temp_value > 255: temp_value = 255
-        node_value[node_level_2] = temp_value
+        node_set(node_level_2, temp_value)
         if node_switch_state[node_level_2] == 1:
             game_timeout = 0
             if node_value[node_level_2] > 64:
-                node_value[node_level_2] = 0
+                node_set(node_level_2, 0)
                 node_level_2 = array_size
 
 def step_level_3():
@@ -945,86 +957,96 @@ def step_level_3():
     global array_size
     if node_1_level_3 != array_size:
         if node_switch_state[node_1_level_3] == 0:
-            node_value[node_1_level_3] = 0
+            node_set(node_1_level_3, 0)
             node_1_level_3 = array_size
             if node_2_level_3 != array_size:
-                node_value[node_2_level_3] = 0
+                node_set(node_2_level_3, 0)
                 node_2_level_3 = array_size
             if node_3_level_3 != array_size:
-                node_value[node_3_level_3] = 0
+                node_set(node_3_level_3, 0)
                 node_3_level_3 = array_size
             return
     if node_2_level_3 != array_size:
         if node_switch_state[node_2_level_3] == 0:
-            node_value[node_2_level_3] = 0
+            node_set(node_2_level_3, 0)
             node_2_level_3 = array_size
             if node_1_level_3 != array_size:
-                node_value[node_1_level_3] = 0
+                node_set(node_1_level_3, 0)
                 node_1_level_3 = array_size
             if node_3_level_3 != array_size:
-                node_value[node_3_level_3] = 0
+                node_set(node_3_level_3, 0)
                 node_3_level_3 = array_size
             return
     if node_3_level_3 != array_size:
         if node_switch_state[node_3_level_3] == 0:
-            node_value[node_3_level_3] = 0
+            node_set(node_3_level_3, 0)
             node_3_level_3 = array_size
             if node_1_level_3 != array_size:
-                node_value[node_1_level_3] = 0
+                node_set(node_1_level_3, 0)
                 node_1_level_3 = array_size
             if node_2_level_3 != array_size:
-                node_value[node_2_level_3] = 0
+                node_set(node_2_level_3, 0)
                 node_2_level_3 = array_size
             return
     if node_1_level_3 == array_size:
-        for node_index in range(0, array_size):
-            if node_switch_state[node_index] == 1:
-                game_timeout = 0
-                node_1_level_3 = node_index
-                node_value[node_1_level_3] = 64
-                return
+        node_index = node_switch_next(0)
+        if node_index < array_size:
+            game_timeout = 0
+            node_1_level_3 = node_index
+            node_set(node_1_level_3, 64)
+            return
     if node_2_level_3 == array_size:
-        for node_index in range(0, array_size):
+        node_index = node_switch_next(0)
+        while node_index < array_size:
             if node_index != node_1_level_3:
-                if node_switch_state[node_index] == 1:
-                    game_timeout = 0
-                    x1, y1 = get_node_coords(node_1_level_3)
-                    x2, y2 = get_node_coords(node_index)
-                    if x1 == x2 and y2 < y1:
-                        node_2_level_3 = node_index
-                        if node_1_level_3 < array_size:
-                            node_value[node_1_level_3] = 128
-                        node_value[node_2_level_3] = 64
-                        return
+                game_timeout = 0
+                x1 = node_x[node_1_level_3]
+                y1 = node_y[node_1_level_3]
+                x2 = node_x[node_index]
+                y2 = node_y[node_index]
+                if x1 == x2 and y2 < y1:
+                    node_2_level_3 = node_index
+                    if node_1_level_3 < array_size:
+                        node_set(node_1_level_3, 128)
+                    node_set(node_2_level_3, 64)
+                    return
+            node_index = node_switch_next(node_index + 1)
     if node_3_level_3 == array_size:
-        for node_index in range(0, array_size):
+        node_index = node_switch_next(0)
+        while node_index < array_size:
             if node_index != node_1_level_3 and node_index != node_2_level_3:
-                if node_switch_state[node_index] == 1:
-                    game_timeout = 0
-                    x1, y1 = get_node_coords(node_2_level_3)
-                    x2, y2 = get_node_coords(node_index)
-                    if y1 == y2 and x2 > x1:
-                        node_3_level_3 = node_index
-                        node_value[node_1_level_3] = 192
-                        node_value[node_2_level_3] = 128
-                        node_value[node_3_level_3] = 64
-                        return
+                game_timeout = 0
+                x1 = node_x[node_2_level_3]
+                y1 = node_y[node_2_level_3]
+                x2 = node_x[node_index]
+                y2 = node_y[node_index]
+                if y1 == y2 and x2 > x1:
+                    node_3_level_3 = node_index
+                    node_set(node_1_level_3, 192)
+                    node_set(node_2_level_3, 128)
+                    node_set(node_3_level_3, 64)
+                    return
+            node_index = node_switch_next(node_index + 1)
     if node_4_level_3 == array_size:
-        for node_index in range(0, array_size):
+        node_index = node_switch_next(0)
+        while node_index < array_size:
             if node_index != node_1_level_3 and node_index != node_2_level_3 and node_index != node_3_level_3:
-                if node_switch_state[node_index] == 1:
-                    game_timeout = 0
-                    x1, y1 = get_node_coords(node_3_level_3)
-                    x2, y2 = get_node_coords(node_index)
-                    x3, y3 = get_node_coords(node_1_level_3)
-                    if x1 == x2 and y2 > y1:
-                        if y2 == y3:
-                            node_4_level_3 = node_index
-                            node_value[node_1_level_3] = 255
-                            node_value[node_2_level_3] = 255
-                            node_value[node_3_level_3] = 255
-                            level_init(4)
-                            return
+                game_timeout = 0
+                x1 = node_x[node_3_level_3]
+                y1 = node_y[node_3_level_3]
+                x2 = node_x[node_index]
+                y2 = node_y[node_index]
+                x3 = node_x[node_1_level_3]
+                y3 = node_y[node_1_level_3]
+                if x1 == x2 and y2 > y1:
+                    if y2 == y3:
+                        node_4_level_3 = node_index
+                        node_set(node_1_level_3, 255)
+                        node_set(node_2_level_3, 255)
+                        node_set(node_3_level_3, 255)
+                        level_init(4)
+                        return
+            node_index = node_switch_next(node_index + 1)
 
 def step_level_4():
     global game_timeout
@@ -1034,7 +1056,7 @@ def step_level_4():
         if node_switch_state[node_index] == 1:
             game_timeout = 0
             click = True
-            node_switch_state[node_index] = 0
+            node_switch_set(node_index, 0)
             temp_value = node_lock[node_index]
             temp_value = temp_value + 1
             if temp_value > 7:
@@ -1065,40 +1087,31 @@ def step_level_4():
 
 def step_level_4_average(index):
     global node_value, field_width, field_height
-    x, y = get_node_coords(index)
-    osum = 0
-    for oy in range(y - 1, y + 2):
-        for ox in range(x - 1, x + 2):
-            if oy < 0 or oy > (field_height - 1) or ox < 0 or ox > (field_width - 1):
-                oval = 128
-            else:
-                if oy == y and ox == x:
-                    oval = 0
-                else:
-                    oval = node_value[get_node_offset(ox, oy)]
-            osum = osum + oval
-    omean = int(osum / 8)
+    near = node_near_8[index]
+    # the field edge counts as 128
+    osum = (8 - len(near)) * 128
+    for node_offset in near:
+        osum = osum + node_value[node_offset]
+    omean = osum // 8
     return omean
 
 def step_level_5():
     global game_timeout
     global started_level_5, array_size, node_switch_state, field_width, node_deform, field_height, node_counter
     if started_level_5 == 0:
-        for node_index in range(0, array_size):
-            if node_switch_state[node_index] == 1:
-                game_timeout = 0
-                started_level_5 = 1
-                for index in range(0, field_width):
-                    node_deform[index] = node_index
-                    node_counter[index] = 1
+        node_index = node_switch_next(0)
+        while node_index < array_size:
+            game_timeout = 0
+            started_level_5 = 1
+            for index in range(0, field_width):
+                node_deform[index] = node_index
+                node_counter[index] = 1
+            node_index = node_switch_next(node_index + 1)
     if started_level_5 == 1:
-        finished = True
-        for node_index in range(0, array_size):
-            if node_switch_state[node_index] == 1:
-                game_timeout = 0
-                finished = False
-        if finished == True:
+        if node_switch_mask == 0:
             started_level_5 = 2
+        else:
+            game_timeout = 0
     if started_level_5 == 2:
         for index in range(0, field_width):
             node_index = node_deform[index]
@@ -1106,13 +1119,15 @@ def step_level_5():
                 if node_switch_state[node_index] == 1:
                     game_timeout = 0
                     node_counter[index] = 2
+        randrange_fill(random_buffer, 64, field_width * 4)
         for index in range(0, field_width):
             if node_counter[index] == 1:
-                bx, by = get_node_coords(node_deform[index])
-                if randrange(0, 64) == 0: bx = bx + 1
-                if randrange(0, 64) == 0: bx = bx - 1
-                if randrange(0, 64) == 0: by = by + 1
-                if randrange(0, 64) == 0: by = by - 1
+                bx = node_x[node_deform[index]]
+                by = node_y[node_deform[index]]
+                if random_buffer[index * 4] == 0: bx = bx + 1
+                if random_buffer[index * 4 + 1] == 0: bx = bx - 1
+                if random_buffer[index * 4 + 2] == 0: by = by + 1
+                if random_buffer[index * 4 + 3] == 0: by = by - 1
                 if bx >= field_width: bx = field_width - 1
                 if bx < 0: bx = 0
                 if by >= field_height: by = field_height - 1
@@ -1152,11 +1167,7 @@ def step_level_6():
         if node_value[node_index] == 255:
             if randrange(0, 12) == 0:
                 node_value[node_index] = 0
-                ox, oy = get_node_coords(node_index)
-                oy = oy + 1
-                if oy == field_height:
-                    oy = 0
-                node_value[get_node_offset(ox, oy)] = 255
+                node_value[node_wrap_4[node_index][1]] = 255
 
 def step_level_7():
     global game_timeout
@@ -1165,30 +1176,23 @@ def step_level_7():
         node_counter[0] = node_counter[0] - 1
         if node_counter[0] == 0:
             for node_index in range(0, 6):
-                node_value[node_lock[node_index]] = 0
+                node_set(node_lock[node_index], 0)
     else:
-        for node_index in range(0, array_size):
-            if node_switch_state[node_index] == 1:
-                game_timeout = 0
-                node_switch_state[node_index] = 0
-                if node_value[node_index] > 0:
-                    node_value[node_index] = 0
-                else:
-                    node_value[node_index] = 128
-        finished = True
+        node_index = node_switch_next(0)
+        while node_index < array_size:
+            game_timeout = 0
+            node_switch_set(node_index, 0)
+            if node_value[node_index] > 0:
+                node_set(node_index, 0)
+            else:
+                node_set(node_index, 128)
+            node_index = node_switch_next(node_index + 1)
+        # every lock lit and nothing else, the locks may repeat so compare
+        # against the distinct count init_level_7() left in locks_level_7
+        finished = node_lit == locks_level_7
         for node_index in range(0, 6):
             if node_value[node_lock[node_index]] == 0:
                 finished = False
-        for node_index in range(0, array_size):
-            if node_value[node_index] > 0:
-                temp_value = False
-                for temp_index in range(0, 6):
-                    if node_lock[temp_index] == node_index:
-                        temp_value = True
-                if temp_value == True:
-                    pass
-                else:
-                    finished = False
         if finished == True:
             level_init(8)
             return
@@ -1199,15 +1203,17 @@ def step_level_8():
     for node_index in range(0, array_size):
         if node_switch_state[node_index] == 1:
             game_timeout = 0
-            px, py = get_node_coords(node_index)
+            px = node_x[node_index]
+            py = node_y[node_index]
             node_offset = get_node_offset(px, 0)
             temp_value = node_counter[node_offset]
             temp_value = temp_value - 1
             if temp_value < 0: temp_value = 0
             node_counter[node_offset] = temp_value
-            node_switch_state[node_index] = 0
+            node_switch_set(node_index, 0)
+    randrange_fill(random_buffer, 100, field_width)
     for xo in range(0, field_width):
-        if randrange(0, 100) == 0:
+        if random_buffer[xo] == 0:
             node_offset = get_node_offset(xo, 0)
             temp_value = node_counter[node_offset]
             temp_value = temp_value + 1
@@ -1233,16 +1239,20 @@ def step_level_8():
 def step_level_9():
     global game_timeout
     global array_size, node_deform, node_counter, node_switch_state, node_value
-    global field_width, field_height
-    for node_index in range(0, array_size):
-        node_value[node_index] = 0
-    for node_index in range(0, array_size):
-        if node_switch_state[node_index] == 1:
-            game_timeout = 0
-            node_counter[1] = node_index
-            node_switch_state[node_index] = 0
+    global field_width, field_height, head_level_9
+    # node_deform is a ring of the last array_size head positions, segment i
+    # sits at slot head_level_9 - i, and node_value holds 1 + the slot of the
+    # newest drawn segment on each node for draw_level_9() to shade
+    node_index = node_switch_next(0)
+    while node_index < array_size:
+        game_timeout = 0
+        node_counter[1] = node_index
+        node_switch_set(node_index, 0)
+        node_index = node_switch_next(node_index + 1)
     if randrange(0, 1) == 0:
-        xo, yo = get_node_coords(node_deform[0])
+        head = head_level_9
+        xo = node_x[node_deform[head]]
+        yo = node_y[node_deform[head]]
         temp_random = randrange(0, 4)
         if temp_random == 0:
             xo = xo + 1
@@ -1257,51 +1267,40 @@ def step_level_9():
             yo = yo - 1
             if yo < 0: yo = 0
         node_offset = get_node_offset(xo, yo)
-        if node_offset != node_deform[0] and node_offset != node_deform[1]:
-            for node_index in range((array_size - 1), 0, -1):
-                node_deform[node_index] = node_deform[node_index -1]
-            node_deform[0] = node_offset
-            if node_deform[0] == node_counter[1]:
+        if node_offset != node_deform[head] and node_offset != node_deform[head - 1]:
+            # the last drawn segment moves out of the body, the new head takes
+            # the slot of the oldest one, never drawn as node_counter[0] < array_size
+            snake_drop((head - node_counter[0] + 1) % array_size)
+            head = (head + 1) % array_size
+            head_level_9 = head
+            node_deform[head] = node_offset
+            node_lock[node_offset] = node_lock[node_offset] + 1
+            node_value[node_offset] = head + 1
+            if node_offset == node_counter[1]:
                 if node_counter[0] > 1:
                     node_counter[0] = node_counter[0] - 1
+                    snake_drop((head - node_counter[0]) % array_size)
                 else:
                     level_init(10)
                     return
                 node_counter[1] = array_size
-    for node_index in range((array_size - 1), -1, -1):
-        if node_index < node_counter[0]:
-            node_offset = node_deform[node_index]
-            if node_offset < array_size:
-                node_value[node_offset] = 150 - (node_index * 2)
-    node_value[node_deform[0]] = 150
-    if node_counter[1] < array_size:
-        node_value[node_counter[1]] = 255
 
 def step_level_10():
     global game_timeout
     global node_value, node_switch_state, field_width, field_height
     for node_index in range(0, array_size):
         if node_switch_state[node_index] == 1:
-            node_switch_state[node_index] = 0
+            node_switch_set(node_index, 0)
             game_timeout = 0
             if node_value[node_index] == 0:
                 node_value[node_index] = 128
             else:
                 node_value[node_index] = 0
-            x, y = get_node_coords(node_index)
-            for oy in range(y - 1, y + 2):
-                for ox in range(x - 1, x + 2):
-                    if oy < 0 or oy > (field_height - 1) or ox < 0 or ox > (field_width - 1):
-                        pass
-                    else:
-                        if oy == y and ox == x:
-                            pass
-                        else:
-                            temp_index = get_node_offset(ox, oy)
-                            if node_value[temp_index] == 0:
-                                node_value[temp_index] = 128
-                            else:
-                                node_value[temp_index] = 0
+            for temp_index in node_near_8[node_index]:
+                if node_value[temp_index] == 0:
+                    node_value[temp_index] = 128
+                else:
+                    node_value[temp_index] = 0
     finished = True
     for node_index in range(0, array_size):
         if node_value[node_index] < 1:
@@ -1316,7 +1315,7 @@ def step_level_11():
     for node_index in range(0, array_size):
         if node_switch_state[node_index] == 1:
             game_timeout = 0
-            node_switch_state[node_index] = 0
+            node_switch_set(node_index, 0)
             if node_deform[node_index] == 0:
                 node_deform[node_index] = 1
     node_lock[0] = node_lock[0] + 1
@@ -1353,9 +1352,10 @@ def step_level_11():
                 temp_value = temp_value - 16
                 if temp_value < 0: temp_value = 0
                 node_value[node_counter[node_index]] = temp_value
+    randrange_fill(random_buffer, 8)
     for node_index in range(0, array_size):
         if node_deform[node_index] == 1:
-            if randrange(0, 8) == 0:
+            if random_buffer[node_index] == 0:
                 if node_velocity[node_index] == 4:
                     node_velocity[node_index] = 8
                 elif node_velocity[node_index] == 2:
@@ -1366,20 +1366,15 @@ def step_level_11():
                     node_velocity[node_index] = 6
     for node_index in range(0, array_size):
         if node_deform[node_index] == 1:
-            xo, yo = get_node_coords(node_counter[node_index])
+            near = node_wrap_4[node_counter[node_index]]
             if node_velocity[node_index] == 8:
-                yo = yo - 1
-                if yo < 0: yo = field_height - 1
+                node_counter[node_index] = near[3]
             elif node_velocity[node_index] == 6:
-                xo = xo + 1
-                if xo >= field_width: xo = 0
+                node_counter[node_index] = near[0]
             elif node_velocity[node_index] == 2:
-                yo = yo + 1
-                if yo >= field_height: yo = 0
+                node_counter[node_index] = near[1]
             elif node_velocity[node_index] == 4:
-                xo = xo - 1
-                if xo < 0: xo = field_width - 1
-            node_counter[node_index] = get_node_offset(xo, yo)
+                node_counter[node_index] = near[2]
 
 def step_level_12():
     global game_timeout
@@ -1401,16 +1396,18 @@ def step_level_12():
     if finished == True:
         level_init(13)
         return
-    xh, yh = get_node_coords(node_deform[0])
+    xh = node_x[node_deform[0]]
+    yh = node_y[node_deform[0]]
     for node_index in range(0, array_size):
         if node_switch_state[node_index] == 1:
             game_timeout = 0
-            node_switch_state[node_index] = 0
+            node_switch_set(node_index, 0)
             if node_index == node_deform[0]:
                 for node_offset in range(0, array_size):
                     node_velocity[node_offset] = 0
             else:
-                xo, yo = get_node_coords(node_index)
+                xo = node_x[node_index]
+                yo = node_y[node_index]
                 if xo == xh:
                     if yh > yo:
                         for y in range(yh - 1, yo - 1, -1):
@@ -1478,7 +1475,7 @@ def step_level_13():
         for node_index in range(0, array_size):
             if node_switch_state[node_index] == 1:
                 game_timeout = 0
-                node_switch_state[node_index] = 0
+                node_switch_set(node_index, 0)
                 temp_value = node_velocity[1]
                 node_offset = node_deform[temp_value]
                 if node_index == node_offset:
@@ -1511,7 +1508,7 @@ def step_level_14():
     global node_value
     for node_index in range(0, array_size):
         if node_switch_state[node_index] == 1:
-            node_switch_state[node_index] = 0
+            node_switch_set(node_index, 0)
             temp_value = node_value[node_index]
             temp_value = temp_value + 32
             if temp_value > 255: temp_value = 0
@@ -1537,44 +1534,53 @@ def check_vendor_code(code): # Play cool cracktro music
 
 def hud_init():
     global hud_value, array_size, hud_code
-    hud_value = [0] * array_size
+    hud_value[:] = node_blank
     hud_code = randrange(0, 32)
 
 def hud_draw():
     global unlocked, vendor_code_entry, game_level
     overscan_fill(0)
     if unlocked == True:
-        x, y = get_node_coords(game_level + 7)
+        x = node_x[game_level + 7]
+        y = node_y[game_level + 7]
         overscan_set_at(x, y, 255)
         for node_index in range(28, 43):
-            x, y = get_node_coords(node_index)
+            x = node_x[node_index]
+            y = node_y[node_index]
             overscan_set_at(x, y, 32)
         for node_index in range(63, 67):
-            x, y = get_node_coords(node_index)
+            x = node_x[node_index]
+            y = node_y[node_index]
             overscan_set_at(x, y, (node_index - 62) * 32)
-        x, y = get_node_coords(55)
+        x = node_x[55]
+        y = node_y[55]
         overscan_set_at(x, y, 16)
-        x, y = get_node_coords(62)
+        x = node_x[62]
+        y = node_y[62]
         if game_timed == True:
             overscan_set_at(x, y, 255)
         else:
             overscan_set_at(x, y, 16)
     else:
         if game_level >= 0 and game_level <= 13:
-            x, y = get_node_coords(game_level)
+            x = node_x[game_level]
+            y = node_y[game_level]
             overscan_set_at(x, y, 255)
         for node_index in range(21,70):
-            x, y = get_node_coords(node_index)
+            x = node_x[node_index]
+            y = node_y[node_index]
             overscan_set_at(x, y, vendor_code_entry[node_index])
         for node_index in range(14, 21):
-            x, y = get_node_coords(node_index)
+            x = node_x[node_index]
+            y = node_y[node_index]
             overscan_set_at(x, y, 32)
         temp_value = 0
         for node_index in range(0, 7):
             if vendor_code_pass[node_index] == True:
                 temp_value = temp_value + 1
         if temp_value > 0:
-            x, y = get_node_coords(temp_value + 13)
+            x = node_x[temp_value + 13]
+            y = node_y[temp_value + 13]
             overscan_set_at(x, y, 128)  
 
 def hud_step():
@@ -1582,21 +1588,22 @@ def hud_step():
     if unlocked == True:
         for node_index in range(28, 43):
             if node_switch_state[node_index] == 1:
-                node_switch_state[node_index] = 0
+                node_switch_set(node_index, 0)
                 temp_value = node_index - 28
                 level_init(temp_value)
         for node_index in range(63, 67):
             if node_switch_state[node_index] == 1:
                 global current_level, current_change
-                node_switch_state[node_index] = 0
+                node_switch_set(node_index, 0)
                 temp_value = node_index - 63
-                current_level = temp_value
-                current_change = True
+                with led_control_lock:
+                    current_level = temp_value
+                    current_change = True
         if node_switch_state[55] == 1:
-            node_switch_state[55] = False
+            node_switch_set(55, 0)
             unlocked = False
         if node_switch_state[62] == 1:
-            node_switch_state[62] = 0
+            node_switch_set(62, 0)
             if game_timed == True:
                 game_timed = False
             else:
@@ -1604,7 +1611,7 @@ def hud_step():
     else:
         for node_index in range(21,70):
             if node_switch_state[node_index] == 1:
-                node_switch_state[node_index] = 0
+                node_switch_set(node_index, 0)
                 if vendor_code_entry[node_index] == 0:
                     vendor_code_entry[node_index] = 128
                 else:
@@ -1612,7 +1619,7 @@ def hud_step():
                 hud_code_check()
 
 def hud_code_check():
-    codes = bytearray(7)
+    codes = hud_codes
     finished = True
     for i in range(0, 7):
         codes[i] = hud_code_get(i)
@@ -1632,13 +1639,9 @@ def hud_code_check():
         
 def hud_code_get(index):
     global vendor_code_entry
-    temp_values = bytearray(7)
-    for i in range(0, 7):
-        node_index = (index * 7) + 21 + i
-        temp_values[i] = vendor_code_entry[node_index] 
     temp_value = 0
     for i in range(0, 7):
-        if temp_values[i] == 0:
+        if vendor_code_entry[(index * 7) + 21 + i] == 0:
             temp_value = temp_value << 1
         else:
             temp_value = temp_value << 1 | 0b1
@@ -1649,6 +1652,8 @@ field_height =          10
 array_size =            field_width * field_height
 
 overscan =				bytearray(array_size)
+overscan_buffers = 		()
+fused_frame = 			False
 
 button_x =              0
 button_y =              0
@@ -1660,10 +1665,49 @@ node_counter =          bytearray(array_size)
 node_velocity =         bytearray(array_size)
 node_switch_state =     bytearray(array_size)
 node_rendered =         bytearray(array_size)
+node_switch_rows =      bytearray(field_height) # presses per row, bit x, kept by node_switch_set()
+node_switch_mask =      0 # bit x set while column x holds a press
+node_switch_lock =      _thread.allocate_lock() # both cores update the switch state, see node_switch_set()
+node_lit =              0 # non-zero node_value entries, kept by node_set() in levels 2, 3 and 7
+node_blank =            bytes(array_size) # level_init() clears the node arrays from this
+row_blank =             bytes(field_height) # and node_switch_rows from this
+level_0_velocity =      b'\x80' * array_size # what the init_level_* functions slice into the node arrays
+level_2_value =         b'\x40' * array_size
+level_4_counter =       b'\x07' * array_size
+level_4_velocity =      b'\x01' * array_size
+level_8_counter =       b'\x01' * field_width
+level_9_deform =        bytes([array_size]) * array_size
+level_11_counter =      bytes(range(0, array_size)) # every node starts on itself
+level_11_value =        b'\x08' * array_size
+level_11_velocity =     b'\x08\x06\x02\x04' # randrange(0, 4) to up, right, down, left
+node_x =                bytearray(array_size + 1) # node offset to x, so lookups need no tuple
+node_y =                bytearray(array_size + 1) # the extra entry covers the array_size "no node" marker
+for node_index in range(0, array_size + 1):
+    node_x[node_index] = node_index % field_width
+    node_y[node_index] = node_index // field_width
+neighbour_4 =           ((1, 0), (0, 1), (-1, 0), (0, -1)) # right, down, left, up
+neighbour_8 =           ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+node_near_4 =           node_neighbour_table(neighbour_4, False) # neighbour offsets per node, none past the edge
+node_near_8 =           node_neighbour_table(neighbour_8, False)
+node_wrap_4 =           node_neighbour_table(neighbour_4, True) # the same wrapped around, for the torus levels
+node_wrap_8 =           node_neighbour_table(neighbour_8, True)
+bit_lowest =            bytearray(1 << field_width) # index of the lowest set bit, for node_switch_next()
+for i in range(1, 1 << field_width):
+    bit_lowest[i] = bit_lowest[i >> 1] + 1 if i & 1 == 0 else 0
+field_clamp =           bytearray(766) # field_clamp[v + 255] is v clipped to 0-255, for v from -255 to 510
+for i in range(0, 766):
+    field_clamp[i] = min(max(i - 255, 0), 255)
+level_0_jitter =        bytearray(24) # velocity 125-130 and a randrange(0, 3) draw to the next velocity
+for i in range(0, 6):
+    level_0_jitter[(i << 2) | 0] = min(125 + i + 1, 130)
+    level_0_jitter[(i << 2) | 1] = max(125 + i - 1, 125)
+    level_0_jitter[(i << 2) | 2] = 125 + i
+    level_0_jitter[(i << 2) | 3] = 125 + i
 
 hud_value =             bytearray(array_size)
 vendor_code_entry = 	bytearray(array_size)
 vendor_code_pass =		bytearray(7)
+hud_codes =				bytearray(7) # scratch for hud_code_check()
 
 badge_type = 			1
 unlocked =				True
@@ -1673,12 +1717,26 @@ ant_rotation =          0
 ant_position =          0
 ant_random =            0
 ant_count =             0
+ant_sum =               0
+random_buffer =         bytearray(array_size)
+random_pool =           0
+random_bits =           0
 
 sub_level_1 =           0
 column_level_1 =        0
 left_level_1 =          0
 right_level_1 =         0
 first_node_level_1 =    0
+level_1_left =          [] # columns left and right of column n, as node_switch_mask bits
+level_1_right =         []
+level_1_on =            [] # n bytes of 255 and of 0, for row fills
+level_1_off =           []
+for i in range(0, field_width):
+    level_1_left.append((1 << i) - 1)
+    level_1_right.append(((1 << field_width) - 1) & ~((2 << i) - 1))
+for i in range(0, field_width + 1):
+    level_1_on.append(b'\xff' * i)
+    level_1_off.append(bytes(i))
 
 node_level_2 =          0
 
@@ -1689,6 +1747,35 @@ node_4_level_3 =        0
 
 started_level_5 =       0
 
+locks_level_7 =         0
+
+head_level_9 =          0
+level_9_ramp =          bytearray(array_size * 2 + 1) # snake shade by head slot + array_size + 1 - node_value
+for i in range(0, array_size * 2 + 1):
+    level_9_ramp[i] = 150 - ((i % array_size) * 2)
+
+# (init, step, draw, level to fall back to on timeout), index is level + 3
+levels = (
+    (init_level_minus_3, step_level_minus_3, level_idle, None),
+    (level_idle, level_idle, level_idle, None),
+    (level_idle, level_idle, level_idle, None),
+    (init_level_0, step_level_0, draw_level_0, None),
+    (init_level_1, step_level_1, draw_node_value, 0),
+    (init_level_2, step_level_2, draw_node_value, 1),
+    (init_level_3, step_level_3, draw_node_value, 2),
+    (init_level_4, step_level_4, draw_node_value, 3),
+    (init_level_5, step_level_5, draw_level_5, 4),
+    (init_level_6, step_level_6, draw_level_6, 5),
+    (init_level_7, step_level_7, draw_node_value, 6),
+    (init_level_8, step_level_8, draw_node_value, 7),
+    (init_level_9, step_level_9, draw_level_9, 8),
+    (level_idle, step_level_10, draw_node_value, 9),
+    (init_level_11, step_level_11, draw_node_value, 10),
+    (init_level_12, step_level_12, draw_node_value, 11),
+    (init_level_13, step_level_13, draw_node_value, 12),
+    (level_idle, step_level_14, draw_node_value, None)
+)
+
 level_init(-3)
 game_level = 0
 game_timeout = 0
@@ -1705,18 +1792,33 @@ fake_press = False
 chip_60 = 				[66, 59, 52, 45, 38, 65, 58, 51, 44, 37, 30, 23, 16, 9, 2, 64, 57, 50, 43, 36, 29, 22, 15, 8, 1, 63, 56, 49, 42, 35, 28, 21, 14, 7, 0]
 chip_63 = 				[6, 13, 20, 27, 34, 41, 48, 55, 62, 69, 5, 12, 19, 26, 33, 40, 47, 54, 61, 68, 4, 11, 18, 25, 32, 39, 46, 53, 60, 67, 3, 10, 17, 24, 31]
 
-buffer_60 = 			bytearray(35)
-buffer_63 = 			bytearray(35)
+frame_buffers = 		(bytearray(72), bytearray(72)) # per chip: 35 PWM registers (0x02-0x24) then the 0x25 latch byte
+frame_tails = 			([], []) # per frame buffer, a view from each offset through its chip's latch byte, for render_push()
+for i in range(0, 2):
+    view = memoryview(frame_buffers[i])
+    for j in range(0, 72):
+        frame_tails[i].append(view[j:((j // 36) * 36) + 36])
+frame_back = 			0 # core 0 draws into this one
+frame_front = 			1 # core 1 sends this one
+frames_dropped = 		0 # drawn but never sent, core 1 was still busy
+frames_repeated = 		0 # core 1 passes with no new frame to send
+frame_sent = 			bytearray(72) # what the chips currently hold, both power up at zero
+frames_sent = 			0
+frames_skipped = 		0
+render_bytes = 			0
+overscan_map = 			bytearray(array_size) # logical node offset to overscan index
+overscan_setup(True)
 
 bounceDelay = 			0.001
 gama_64 =				[0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 14, 16, 18, 20, 22, 24, 26, 29, 32, 35, 38, 41, 44, 47, 50, 53, 57, 61, 65, 69, 73, 77, 81, 85, 89, 94, 99, 104, 109, 114, 119, 124, 129, 134, 140, 146, 152, 158, 164, 170, 176, 182, 188, 195, 202, 209, 216, 223, 230, 237, 244, 251, 255]
 gama_32 = 				[0, 1, 2, 4, 6, 10, 13, 18, 22, 28, 33, 39, 46, 53, 61, 69, 78, 86, 96, 106, 116, 126, 138, 149, 161, 173, 186, 199, 212, 226, 240, 255]
 gama_16 =				[0, 2, 6, 13, 22, 33, 46, 61, 78, 96, 116, 138, 161, 186, 212, 240]
+gamma_lut = 			bytearray(256) # 8-bit value to PWM, rebuilt by gamma_select()
+gamma_select(gama_64)
 addrMap = 				[[0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C],[0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C],[0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C,0x3C],[0x3F,0x3F,0x3F,0x3F,0x3F,0x3C,0x3C,0x3C,0x3C,0x3C],[0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F],[0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F],[0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F,0x3F]]
 LEDmap = 				[[36,35,34,33,32,31,30,29,28,27],[26,25,24,23,22,21,20,19,18,17],[16,15,14,13,12,11,10,9,8,7],[32,33,34,35,36,6,5,4,3,2],[22,23,24,25,26,27,28,29,30,31],[12,13,14,15,16,17,18,19,20,21],[2,3,4,5,6,7,8,9,10,11]]
 
-coreXfer_buttonStates = [[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0]]
-coreXfer_buttonStates_old = [[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0],[0,0,0,0,0,0,0,0,0,0]]
+row_masks = 			[0, 0, 0, 0, 0, 0, 0] # last scanned column bits per row, bit n is col(n + 1)
 
 row1 = machine.Pin(2, machine.Pin.OUT, value=1)
 row2 = machine.Pin(3, machine.Pin.OUT, value=1)
@@ -1736,84 +1838,92 @@ led = machine.Pin(25, machine.Pin.OUT)
 col5 = machine.Pin(26, machine.Pin.IN)
 col7 = machine.Pin(27, machine.Pin.IN)
 col9 = machine.Pin(28, machine.Pin.IN)
+row_pins = (row1, row2, row3, row4, row5, row6, row7)
+col_pins = (col1, col2, col3, col4, col5, col6, col7, col8, col9, col10)
+
+pio_scan = False
+key_sm = None
+key_sm_row = 0
+pio_cols_low = [0] * 128 # PIO sample bits 0-6 (col10, col8, col6, col4, col3, col2, col1) to row mask
+for i in range(0, 128):
+    for bit, col in ((0, 9), (1, 7), (2, 5), (3, 3), (4, 2), (5, 1), (6, 0)):
+        if i & (1 << bit):
+            pio_cols_low[i] = pio_cols_low[i] | (1 << col)
+pio_cols_high = (0, 1 << 4, 1 << 6, (1 << 4) | (1 << 6), 1 << 8, (1 << 4) | (1 << 8), (1 << 6) | (1 << 8), (1 << 4) | (1 << 6) | (1 << 8)) # bits 21-23: col5, col7, col9
 
 i2c = 					machine.I2C(0, scl=machine.Pin(1), sda=machine.Pin(0), freq=100000)
+led_currents = 			(b'\x07' * 36, b'\x05' * 36, b'\x03' * 36, b'\x01' * 36) # LED control payload per current level, Imax / 4 up to Imax
+led_control = 			bytearray(72) # LED control registers 0x26-0x49, per chip
+led_control_views = 	(memoryview(led_control)[0:36], memoryview(led_control)[36:72])
+led_control_slot = 		bytearray(array_size) # node offset to its led_control byte
+led_control_lock = 		_thread.allocate_lock() # core 0 stages led_control changes, core 1 sends them, see core1_thread()
+for i in range(0, 35):
+    led_control_slot[chip_60[i]] = 1 + i
+    led_control_slot[chip_63[i]] = 37 + i
+led_imax_ua = 			20000 # output current at full scale, set by the driver's REXT
+led_scale = 			[0] * 72 # microamps per LED at PWM 255, from led_control
+power_budget_ua = 		0 # average LED current allowed per frame, 0 for no limit
+power_estimate_ua = 	0 # of the last frame checked
+frames_power_limited = 	0
 led_init()
 
 current_change = False
 current_level = 0
 flip = False
 
+frame_period_ms =       30 # target time per drawn frame
+step_period_ms =        30 # game logic rate, independent of the frame rate
+step_catchup =          4 # most game steps run in one frame when behind
+step_budget =           step_catchup
+frame_next =            utime.ticks_ms()
+step_next =             frame_next
+frame_overruns =        0
+
+gc_budget =             16384 # heap growth allowed before collecting in a frame's slack
+gc_slack_ms =           5 # only collect when at least this much of the frame is left
+gc_threshold =          32768 # backstop, the VM collects by itself past this much allocation
+gc_collect_at =         gc.mem_alloc() + gc_budget
+gc_collects =           0
+gc_stats =              False # print per-level heap growth every gc_report_frames frames
+gc_report_frames =      100
+gc_frames =             0
+gc_last_alloc =         gc.mem_alloc()
+gc_level_bytes =        [0] * 19 # per level -3 to 14, then the HUD
+gc_level_frames =       [0] * 19
+gc.threshold(gc_threshold)
+
 core1_thread = _thread.start_new_thread(core1_thread, ())
 
 # My vars
 to_print = "CYPHERCON "
 str_idx = 0
 scroll_speed = 200
-next_update = utime.ticks_ms() + scroll_speed
+next_update = utime.ticks_add(utime.ticks_ms(), scroll_speed)
 print_width = len(to_print) * 7
-current_letter = 0
-letter_col = 0
-screen_array = [
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0],
-    [0,0,0,0,0,0,0]
-]
+marquee = marquee_strip(to_print, font_5x7)
+marquee_column = 0
+scroll_view = bytearray(array_size) # field rows as a ring, see scroll_push()
+scroll_head = 0 # ring slot of the field's top row
 
 while True:
-    gc.collect()
     step_level_minus_3()
     
     # My stuff
-    if utime.ticks_ms() > next_update:
+    if utime.ticks_diff(utime.ticks_ms(), next_update) > 0:
         str_idx = str_idx + 1
         if str_idx >= len(to_print):
             str_idx = 0
             
-        # Fill the frame buffer
-        
-        # Shift the frame left
-        for i in range(9):
-            for j in range(7):
-                screen_array[i][j] = screen_array[i+1][j]
-                
-        if letter_col >= 5:
-            letter_col = 0
-            current_letter = current_letter + 1
-            if current_letter >= len(to_print):
-                current_letter = 0
-            # Add a space between letters
-            for i in range(7):
-                screen_array[9][i] = 0
-        else:    
-                
-            the_letter = to_print[current_letter]
-            for i in range(7):
-                if letters[the_letter][6-i][letter_col] == '*':
-                    screen_array[9][i] = 255
-                else:
-                    screen_array[9][i] = 0
-            letter_col = letter_col + 1
-
-#        for i in range(7):
-#            for j in range(5):
-#                if letters[the_letter][i][j] == '*':
-#                    screen_array[j][i] = 200
-        next_update = utime.ticks_ms() + scroll_speed
+        scroll_push(marquee[marquee_column])
+        marquee_column = marquee_column + 1
+        if marquee_column >= len(marquee):
+            marquee_column = 0
+
+        next_update = utime.ticks_add(utime.ticks_ms(), scroll_speed)
     
-    overscan_fill(0)
-    for i in range(10):
-        for j in range(7):
-            overscan_set_at(j, i, screen_array[i][j])
-    flip = True
-    utime.sleep(.03)
+    overscan_blit_ring(scroll_view, scroll_head * field_width)
+    frame_present()
+    frame_wait()
     continue
     # End my stuff
     
@@ -1827,7 +1937,7 @@ while True:
         if temp_check == True:
             hud_counter = hud_counter + 1
             if hud_counter > 255:
-                node_switch_state[0] = 0
+                node_switch_set(0, 0)
                 hud_counter = 0
                 hud_was_pressed = 0
                 hud_pressed = 0
@@ -1842,24 +1952,27 @@ while True:
             hud_counter = 0
             hud_was_pressed = 0
             hud_pressed = 0
-            node_switch_state[0] = 1
+            node_switch_set(0, 1)
             fake_press = True
     else:
         if hud_was_pressed == 1:
             hud_was_pressed = 0
             hud_counter = 0
-            node_switch_state[0] = 1
+            node_switch_set(0, 1)
             fake_press = True
         else:
             pass
     if game_mode == 0:
-        step()
+        while step_due() == True:
+            step()
+            if fake_press == True:
+                # a frame can finish before any step is due, so the synthetic
+                # press stays down until a step has had the chance to see it
+                fake_press = False
+                node_switch_set(0, 0)
         draw()
-        if fake_press == True:
-            fake_press = False
-            node_switch_state[0] = 0
     else:
         hud_step()
         hud_draw()
-    flip = True
-    utime.sleep(.03)
\ No newline at end of file
+    frame_present()
+    frame_wait()
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""Host-side stand-ins for the badge hardware.
+
+Nothing in here runs on the badge. It lets the MicroPython programs in
+this repo run, be profiled and be benchmarked on a regular Python 3
+install:
+
+    python -m sim josh-code/main.py --seconds 5
+
+install() puts the stand-ins for machine, rp2, utime, _thread and gc in
+sys.modules. run() executes a badge program against a freshly reset
+board. board (sim.board.board) is the virtual badge the program sees: key
+matrix, LED drivers and clock.
+"""
+
+import sys
+import threading
+
+from sim.board import board, SimulationStop
+
+_MODULES = ("machine", "rp2", "utime", "_thread", "gc")
+_saved = {}
+
+
+class MicroPythonBytearray(bytearray):
+    """bytearray that stores ints the way MicroPython does.
+
+    MicroPython keeps the low 8 bits of an out-of-range value where
+    CPython raises ValueError, and the badge code relies on that.
+    """
+
+    def __setitem__(self, index, value):
+        if isinstance(value, int):
+            value &= 0xFF
+        bytearray.__setitem__(self, index, value)
+
+
+def install():
+    import sim.machine
+    import sim.rp2
+    import sim.utime
+    import sim._thread
+    import sim.gc
+    stand_ins = {
+        "machine": sim.machine,
+        "rp2": sim.rp2,
+        "utime": sim.utime,
+        "_thread": sim._thread,
+        "gc": sim.gc,
+    }
+    for name in _MODULES:
+        if name not in _saved:
+            _saved[name] = sys.modules.get(name)
+        sys.modules[name] = stand_ins[name]
+
+
+def uninstall():
+    for name, module in _saved.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
+    _saved.clear()
+
+
+def run(path, seconds=None, threads=True, speed=None, setup=None, wrap_bytes=True):
+    """Run the badge program at path, return its globals.
+
+    The program's main loop never returns, so the run ends when the
+    virtual clock reaches `seconds` (None runs until interrupted).
+    seconds=0 stops at the first sleep in the main loop, which leaves
+    every function and global initialised for calling directly. Core 1
+    is stopped once run() returns.
+    setup(board) is called after the board is reset and before the
+    program starts, to script key presses and the like. wrap_bytes gives
+    the program MicroPythonBytearray in place of bytearray.
+    """
+    install()
+    board.reset()
+    board.threads = threads
+    board.clock.owner = threading.get_ident()
+    board.clock.speed = speed
+    if seconds is not None:
+        board.clock.deadline_us = int(seconds * 1000000)
+    if setup is not None:
+        setup(board)
+    with open(path) as f:
+        code = compile(f.read(), path, "exec")
+    namespace = {"__name__": "__main__", "__file__": path}
+    if wrap_bytes:
+        namespace["bytearray"] = MicroPythonBytearray
+    try:
+        exec(code, namespace)
+    except SimulationStop:
+        pass
+    finally:
+        board.clock.stop()
+        board.clock.resume()
+    return namespace
@@ -0,0 +1,59 @@
+"""Run a badge program on the virtual board.
+
+    python -m sim josh-code/main.py --seconds 10 --tap 1000:3,4
+"""
+
+import argparse
+import cProfile
+import pstats
+
+import sim
+from sim.board import board
+
+
+def parse_tap(text):
+    at, _, key = text.partition(":")
+    x, y = key.split(",")[:2]
+    return int(at), int(x), int(y)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m sim", description=__doc__.splitlines()[0])
+    parser.add_argument("program", help="badge main.py to run")
+    parser.add_argument("--seconds", type=float, default=5.0, help="virtual seconds to run for")
+    parser.add_argument("--tap", action="append", default=[], metavar="MS:X,Y",
+                        help="press key X,Y at virtual time MS for 100 ms, repeatable")
+    parser.add_argument("--hold", type=int, default=100, help="how long each --tap is held, in ms")
+    parser.add_argument("--realtime", action="store_true", help="pace the virtual clock to the wall clock")
+    parser.add_argument("--no-core1", action="store_true", help="do not start the core 1 thread")
+    parser.add_argument("--profile", action="store_true", help="print a cProfile summary of core 0")
+    args = parser.parse_args()
+
+    taps = [parse_tap(t) for t in args.tap]
+
+    def setup(board):
+        for at, x, y in taps:
+            board.keys.tap(x, y, at, args.hold)
+
+    def go():
+        return sim.run(args.program, seconds=args.seconds, threads=not args.no_core1,
+                       speed=1.0 if args.realtime else None, setup=setup)
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(go)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    else:
+        go()
+
+    bus = board.i2c
+    print(board.ascii())
+    print("virtual time:     %.3f s" % (board.clock.us / 1000000))
+    print("latched frames:   %d / %d" % (bus.chips[0x3C].updates, bus.chips[0x3F].updates))
+    print("i2c transactions: %d" % bus.transactions)
+    print("i2c bytes:        %d" % bus.wire_bytes)
+    print("i2c bus time:     %.3f s" % (bus.bus_time_us() / 1000000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Stand-in for MicroPython's _thread module.
+
+start_new_thread() is how the badge code starts core 1. With
+board.threads set it runs the function on a real daemon thread whose
+sleeps follow the virtual clock. Otherwise the function is only recorded
+in board.core1 and the caller drives core 1's work by hand.
+"""
+
+import threading
+
+from sim.board import board, SimulationStop
+
+
+def start_new_thread(function, args, kwargs=None):
+    board.core1 = (function, args)
+    if not board.threads:
+        return 0
+
+    def core1():
+        board.clock.join()
+        try:
+            function(*args, **(kwargs or {}))
+        except SimulationStop:
+            pass
+        finally:
+            board.clock.leave()
+
+    thread = threading.Thread(target=core1, name="core1", daemon=True)
+    thread.start()
+    return thread.ident
+
+
+def allocate_lock():
+    return threading.Lock()
+
+
+def get_ident():
+    return threading.get_ident()
+
+
+def exit():
+    raise SystemExit
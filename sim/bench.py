@@ -0,0 +1,275 @@
+"""Per-level frame benchmark for the badge code.
+
+For every game level (-3 to 14) and the HUD this runs a number of frames
+with a scripted input trace. It reports the mean time per frame spent in
+handle_events(), step(), draw() and render(), the resulting frame rate,
+bytes allocated per frame and I2C traffic per frame. The results are
+also written to a JSON file so two runs can be compared.
+
+On the host, against the simulator:
+
+    python -m sim.bench josh-code/main.py --frames 300 --out bench.json
+
+On the badge: copy this file over as bench.py, stop main.py with Ctrl-C
+and, from the REPL:
+
+    import bench
+    bench.run(globals())
+
+The module only uses what MicroPython has. On the badge, times come from
+utime.ticks_us() and allocations from gc.mem_alloc() with the collector
+held off. On the host they come from time.perf_counter() and tracemalloc.
+Compare numbers from the same platform only.
+"""
+
+import gc
+import json
+import sys
+
+LEVELS = (-3, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, "hud")
+
+if sys.implementation.name == "micropython":
+    import utime
+
+    def _now():
+        return utime.ticks_us()
+
+    def _since(start):
+        return utime.ticks_diff(utime.ticks_us(), start)
+
+    def _alloc_begin():
+        gc.collect()
+        gc.disable()
+        return gc.mem_alloc()
+
+    def _alloc_end(start):
+        used = gc.mem_alloc() - start
+        gc.enable()
+        return used
+
+    def _alloc_setup():
+        pass
+
+    def _alloc_teardown():
+        pass
+else:
+    import time
+    import tracemalloc
+
+    def _now():
+        return time.perf_counter()
+
+    def _since(start):
+        return int((time.perf_counter() - start) * 1000000)
+
+    def _alloc_begin():
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def _alloc_end(start):
+        return max(0, tracemalloc.get_traced_memory()[1] - start)
+
+    def _alloc_setup():
+        tracemalloc.start()
+
+    def _alloc_teardown():
+        tracemalloc.stop()
+
+
+class CountingI2C:
+    """Wraps the program's i2c object and counts what goes through it."""
+
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.transactions = 0
+        self.bytes = 0
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self.transactions += 1
+        self.bytes += len(buf)
+        return self.i2c.writeto_mem(addr, memaddr, buf)
+
+
+class Trace:
+    """Deterministic key presses, identical on the host and the badge.
+
+    A small LCG so the sequence does not depend on either platform's
+    random module.
+    """
+
+    def __init__(self, seed):
+        self.state = seed & 0x7FFFFFFF
+        self.down = []
+
+    def next(self, modulo):
+        self.state = (self.state * 1103515245 + 12345) & 0x7FFFFFFF
+        return (self.state >> 8) % modulo
+
+    def apply(self, ns):
+        roll = self.next(100)
+        if roll < 15:
+            x = self.next(7)
+            y = self.next(10)
+            self.down.append((x, y))
+            ns["left_click_down_event"](x, y)
+        elif roll < 30 and self.down:
+            x, y = self.down.pop(0)
+            ns["left_click_up_event"](x, y)
+
+
+def _enter(ns, level):
+    if "frame_show" in ns:
+        # send anything the main loop left pending, so the first frame is ours
+        ns["frame_show"]()
+    if level == "hud":
+        ns["game_mode"] = 1
+        ns["level_init"](0)
+        ns["hud_init"]()
+    else:
+        ns["game_mode"] = 0
+        ns["level_init"](level)
+
+
+def _frame(ns, level, times):
+    start = _now()
+    ns["handle_events"]()
+    times[0] += _since(start)
+    start = _now()
+    if level == "hud":
+        ns["hud_step"]()
+    else:
+        ns["step"]()
+    times[1] += _since(start)
+    start = _now()
+    if level == "hud":
+        ns["hud_draw"]()
+    else:
+        ns["draw"]()
+    times[2] += _since(start)
+    start = _now()
+    if "frame_show" in ns:
+        # hand the frame over and send it, as core 1 would
+        ns["frame_present"]()
+        ns["frame_show"]()
+    else:
+        ns["render"]()
+    times[3] += _since(start)
+
+
+def _overhead(frames):
+    """Bytes the measuring itself allocates per frame, subtracted from results."""
+    def nothing():
+        pass
+    stub = {"handle_events": nothing, "step": nothing, "draw": nothing, "render": nothing}
+    scratch = [0, 0, 0, 0]
+    alloc = 0
+    _alloc_setup()
+    try:
+        for _ in range(frames):
+            start = _alloc_begin()
+            _frame(stub, 0, scratch)
+            alloc += _alloc_end(start)
+    finally:
+        _alloc_teardown()
+    return alloc // frames
+
+
+def bench_level(ns, level, frames=200, seed=1, overhead=0):
+    """Run one level for `frames` frames, return a dict of results."""
+    bus = CountingI2C(ns["i2c"])
+    real_i2c = ns["i2c"]
+    ns["i2c"] = bus
+    ns["game_timed"] = False
+    times = [0, 0, 0, 0]
+    exits = 0
+    try:
+        _enter(ns, level)
+        trace = Trace(seed)
+        for _ in range(frames):
+            trace.apply(ns)
+            _frame(ns, level, times)
+            if level != "hud" and ns["game_level"] != level:
+                # the trace finished the level, keep measuring this one
+                exits += 1
+                _enter(ns, level)
+        transactions = bus.transactions
+        i2c_bytes = bus.bytes
+
+        _enter(ns, level)
+        trace = Trace(seed)
+        alloc = 0
+        scratch = [0, 0, 0, 0]
+        _alloc_setup()
+        try:
+            for _ in range(frames):
+                trace.apply(ns)
+                start = _alloc_begin()
+                _frame(ns, level, scratch)
+                alloc += _alloc_end(start)
+                if level != "hud" and ns["game_level"] != level:
+                    _enter(ns, level)
+        finally:
+            _alloc_teardown()
+    finally:
+        ns["i2c"] = real_i2c
+    total = times[0] + times[1] + times[2] + times[3]
+    return {
+        "events_us": times[0] // frames,
+        "step_us": times[1] // frames,
+        "draw_us": times[2] // frames,
+        "render_us": times[3] // frames,
+        "frame_us": total // frames,
+        "fps": (frames * 1000000 // total) if total else 0,
+        "alloc_bytes": max(0, alloc // frames - overhead),
+        "i2c_bytes": i2c_bytes // frames,
+        "i2c_transactions": transactions // frames,
+        "level_exits": exits,
+    }
+
+
+def run(ns, frames=200, levels=LEVELS, out="bench.json", seed=1):
+    """Benchmark every level in `levels` against the program globals `ns`."""
+    results = {}
+    overhead = _overhead(frames)
+    print("level  events    step    draw  render     fps  alloc/f  i2c B/f")
+    for level in levels:
+        r = bench_level(ns, level, frames, seed, overhead)
+        results[str(level)] = r
+        print("%5s %7d %7d %7d %7d %7d %8d %8d" % (level, r["events_us"], r["step_us"], r["draw_us"],
+                                                   r["render_us"], r["fps"], r["alloc_bytes"], r["i2c_bytes"]))
+    report = {
+        "platform": sys.platform,
+        "implementation": sys.implementation.name,
+        "frames": frames,
+        "seed": seed,
+        "levels": results,
+    }
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f)
+    return report
+
+
+def main():
+    import argparse
+
+    import sim
+
+    parser = argparse.ArgumentParser(prog="python -m sim.bench", description="Per-level frame benchmark.")
+    parser.add_argument("program", help="badge main.py to load")
+    parser.add_argument("--frames", type=int, default=200, help="frames per level")
+    parser.add_argument("--seed", type=int, default=1, help="input trace seed")
+    parser.add_argument("--level", action="append", help="only run this level (repeatable, 'hud' for the HUD)")
+    parser.add_argument("--out", default="bench.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    levels = LEVELS
+    if args.level:
+        levels = tuple(level if level == "hud" else int(level) for level in args.level)
+    # stop at the first sleep of the main loop, everything is set up by then
+    ns = sim.run(args.program, seconds=0, threads=False)
+    run(ns, args.frames, levels, args.out, args.seed)
+
+
+if __name__ == "__main__":
+    main()
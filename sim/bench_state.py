@@ -0,0 +1,167 @@
+"""Level state in module globals against a __slots__ object.
+
+The badge code keeps level state in module globals (node_value,
+node_counter, ... and a handful of ints) that level_init() resets by
+slice assignment. The alternative is one object per level, with
+__slots__ fields. This times the operations that decide between them,
+written once in each style:
+
+    reset   level_init()'s six 70-byte slice resets plus three ints
+    scan    a step_level_* style pass over all nodes, reading two arrays
+            and writing one
+    scalar  read-modify-write of one int, the step functions' counters
+
+On the host:
+
+    python -m sim.bench_state --rounds 2000
+
+On the badge: copy this file over as bench_state.py, stop main.py with
+Ctrl-C and, from the REPL:
+
+    import bench_state
+    bench_state.run()
+
+Times are per call in microseconds. As with sim.bench, only compare
+numbers from the same platform.
+"""
+
+import sys
+
+if sys.implementation.name == "micropython":
+    import utime
+
+    def _now():
+        return utime.ticks_us()
+
+    def _since(start):
+        return utime.ticks_diff(utime.ticks_us(), start)
+else:
+    import time
+
+    def _now():
+        return time.perf_counter()
+
+    def _since(start):
+        return int((time.perf_counter() - start) * 1000000)
+
+ARRAY_SIZE = 70
+
+node_blank = bytes(ARRAY_SIZE)
+node_counter = bytearray(ARRAY_SIZE)
+node_switch_state = bytearray(ARRAY_SIZE)
+node_lock = bytearray(ARRAY_SIZE)
+node_velocity = bytearray(ARRAY_SIZE)
+node_value = bytearray(ARRAY_SIZE)
+node_deform = bytearray(ARRAY_SIZE)
+button_x = 0
+button_y = 0
+game_timeout = 0
+
+
+class LevelState:
+    __slots__ = ("counter", "switch_state", "lock", "velocity", "value", "deform",
+                 "button_x", "button_y", "timeout")
+
+    def __init__(self):
+        self.counter = bytearray(ARRAY_SIZE)
+        self.switch_state = bytearray(ARRAY_SIZE)
+        self.lock = bytearray(ARRAY_SIZE)
+        self.velocity = bytearray(ARRAY_SIZE)
+        self.value = bytearray(ARRAY_SIZE)
+        self.deform = bytearray(ARRAY_SIZE)
+        self.button_x = 0
+        self.button_y = 0
+        self.timeout = 0
+
+
+def reset_globals(state):
+    global button_x, button_y, game_timeout
+    node_counter[:] = node_blank
+    node_switch_state[:] = node_blank
+    node_lock[:] = node_blank
+    node_velocity[:] = node_blank
+    node_value[:] = node_blank
+    node_deform[:] = node_blank
+    button_x = 0
+    button_y = 0
+    game_timeout = 0
+
+
+def reset_slots(state):
+    state.counter[:] = node_blank
+    state.switch_state[:] = node_blank
+    state.lock[:] = node_blank
+    state.velocity[:] = node_blank
+    state.value[:] = node_blank
+    state.deform[:] = node_blank
+    state.button_x = 0
+    state.button_y = 0
+    state.timeout = 0
+
+
+def scan_globals(state):
+    global game_timeout
+    for node_index in range(0, ARRAY_SIZE):
+        if node_switch_state[node_index] == 1:
+            game_timeout = 0
+        node_value[node_index] = node_counter[node_index]
+
+
+def scan_slots(state):
+    for node_index in range(0, ARRAY_SIZE):
+        if state.switch_state[node_index] == 1:
+            state.timeout = 0
+        state.value[node_index] = state.counter[node_index]
+
+
+def scalar_globals(state):
+    global game_timeout
+    game_timeout = game_timeout + 1
+    if game_timeout >= 1000:
+        game_timeout = 0
+
+
+def scalar_slots(state):
+    state.timeout = state.timeout + 1
+    if state.timeout >= 1000:
+        state.timeout = 0
+
+
+CASES = (
+    ("reset", reset_globals, reset_slots),
+    ("scan", scan_globals, scan_slots),
+    ("scalar", scalar_globals, scalar_slots),
+)
+
+
+def _time(fn, state, rounds):
+    start = _now()
+    for _ in range(rounds):
+        fn(state)
+    return _since(start) / rounds
+
+
+def run(rounds=2000):
+    """Time every case both ways, return {case: (globals_us, slots_us)}."""
+    state = LevelState()
+    results = {}
+    print("case      globals    slots  slots/globals")
+    for name, with_globals, with_slots in CASES:
+        g = _time(with_globals, state, rounds)
+        s = _time(with_slots, state, rounds)
+        results[name] = (g, s)
+        print("%-6s %10.2f %8.2f %14.2f" % (name, g, s, s / g if g else 0))
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m sim.bench_state", description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000, help="calls per case")
+    args = parser.parse_args()
+    run(args.rounds)
+
+
+if __name__ == "__main__":
+    main()
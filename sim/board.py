@@ -0,0 +1,278 @@
+"""The virtual badge: GPIO state, key matrix, LED drivers and clock.
+
+One Board instance, `board`, backs every stand-in module. reset() puts it
+back to power-on state so several programs can be run in one process.
+"""
+
+import threading
+import time
+
+from sim.i2c import BadgeI2C
+
+
+# Key matrix wiring. Row n is driven low to select it. A pressed key pulls
+# its column low while its row is selected. Key (row, col) is node
+# offset col * 7 + row in the badge code.
+ROW_GPIOS = (2, 3, 4, 22, 12, 13, 14)
+COL_GPIOS = (11, 10, 9, 8, 26, 7, 27, 6, 28, 5)
+
+# IS31FL3236 outputs behind each node. These are the addrMap / LEDmap
+# tables from the badge code, indexed [row][col].
+LED_ADDRESS = (
+    (0x3C,) * 10,
+    (0x3C,) * 10,
+    (0x3C,) * 10,
+    (0x3F,) * 5 + (0x3C,) * 5,
+    (0x3F,) * 10,
+    (0x3F,) * 10,
+    (0x3F,) * 10,
+)
+LED_OUTPUT = (
+    (36, 35, 34, 33, 32, 31, 30, 29, 28, 27),
+    (26, 25, 24, 23, 22, 21, 20, 19, 18, 17),
+    (16, 15, 14, 13, 12, 11, 10, 9, 8, 7),
+    (32, 33, 34, 35, 36, 6, 5, 4, 3, 2),
+    (22, 23, 24, 25, 26, 27, 28, 29, 30, 31),
+    (12, 13, 14, 15, 16, 17, 18, 19, 20, 21),
+    (2, 3, 4, 5, 6, 7, 8, 9, 10, 11),
+)
+
+FIELD_WIDTH = 7
+FIELD_HEIGHT = 10
+
+
+class SimulationStop(BaseException):
+    """Raised inside the badge program when the run is over.
+
+    BaseException so that badge code catching Exception cannot swallow it.
+    """
+
+
+class Clock:
+    """Virtual microsecond clock.
+
+    Only the thread running the badge's main program (core 0) moves time
+    forward, by sleeping. Other threads (core 1) block in their sleeps
+    until core 0 has advanced the clock past their wake-up time, and core
+    0 waits for them to get back to sleep before it carries on, so both
+    cores see one consistent timeline. Nothing ever waits on the wall
+    clock unless `speed` is set.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.local = threading.local()
+        self.epoch = 0
+        self.reset()
+
+    def reset(self):
+        with self.cond:
+            self.epoch += 1
+            self.us = 0
+            self.deadline_us = None
+            self.stopped = False
+            self.owner = None
+            self.speed = None
+            # thread ident to wake-up time, None while that thread is running
+            self.sleepers = {}
+            self.cond.notify_all()
+
+    def now_us(self):
+        return self.us
+
+    def join(self):
+        """Called on a new core 1 thread before it runs any badge code."""
+        self.local.epoch = self.epoch
+
+    def sleep_us(self, us):
+        us = max(0, int(us))
+        if self.owner is None or threading.get_ident() == self.owner:
+            self._advance(us)
+        else:
+            self._wait(us)
+
+    def _advance(self, us):
+        if not self.sleepers and self.deadline_us is None and not self.speed:
+            # nobody to wake and nothing to pace, skip the locking
+            self.us += us
+            return
+        with self.cond:
+            if self.stopped:
+                raise SimulationStop
+            target = self.us + us
+            if self.deadline_us is not None and target >= self.deadline_us:
+                self.us = self.deadline_us
+                self.stopped = True
+                self.cond.notify_all()
+                raise SimulationStop
+            # step through every core 1 wake-up that falls inside this sleep
+            while self.sleepers:
+                wakes = [w for w in self.sleepers.values() if w is not None and w < target]
+                self.us = min(wakes) if wakes else target
+                self.cond.notify_all()
+                # a core 1 that never sleeps would hold us up forever, hence the timeout
+                if not self.cond.wait_for(self._settled, timeout=0.05) or not wakes:
+                    break
+            self.us = target
+        if self.speed:
+            time.sleep(us / 1000000 / self.speed)
+
+    def _settled(self):
+        for wake in self.sleepers.values():
+            if wake is None or wake <= self.us:
+                return False
+        return True
+
+    def _wait(self, us):
+        me = threading.get_ident()
+        with self.cond:
+            if getattr(self.local, "epoch", self.epoch) != self.epoch:
+                # left over from an earlier run()
+                raise SimulationStop
+            wake = self.us + us
+            self.sleepers[me] = wake
+            self.cond.notify_all()
+            # the timeout only matters if core 0 stops sleeping altogether
+            self.cond.wait_for(lambda: self.stopped or self.us >= wake, timeout=0.5)
+            if self.stopped or self.local.epoch != self.epoch:
+                self.sleepers.pop(me, None)
+                raise SimulationStop
+            self.sleepers[me] = None
+
+    def leave(self):
+        with self.cond:
+            self.sleepers.pop(threading.get_ident(), None)
+            self.cond.notify_all()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def resume(self):
+        """Let core 0 keep calling into the program after a run has ended.
+
+        Core 1 threads from the run stay stopped.
+        """
+        with self.cond:
+            self.epoch += 1
+            self.stopped = False
+            self.deadline_us = None
+            self.sleepers = {}
+            self.cond.notify_all()
+
+
+class Keys:
+    """The 7x10 switch matrix, addressed the way the badge code does: (x, y)."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.pressed = set()
+        self.script = []
+
+    def press(self, x, y):
+        self.pressed.add((x, y))
+
+    def release(self, x, y):
+        self.pressed.discard((x, y))
+
+    def release_all(self):
+        self.pressed.clear()
+
+    def tap(self, x, y, at_ms, hold_ms=100):
+        """Schedule a press at virtual time at_ms, released hold_ms later."""
+        self.schedule(at_ms, x, y, True)
+        self.schedule(at_ms + hold_ms, x, y, False)
+
+    def schedule(self, at_ms, x, y, down):
+        self.script.append((at_ms * 1000, x, y, down))
+        self.script.sort(key=lambda event: event[0])
+
+    def update(self):
+        now = self.clock.us
+        while self.script and self.script[0][0] <= now:
+            _, x, y, down = self.script.pop(0)
+            if down:
+                self.press(x, y)
+            else:
+                self.release(x, y)
+
+
+class Board:
+    def __init__(self):
+        self.clock = Clock()
+        self.keys = Keys(self.clock)
+        self.threads = True
+        self.reset()
+
+    def reset(self):
+        self.clock.reset()
+        self.keys.reset()
+        self.gpio_mode = {}
+        self.gpio_out = {}
+        self.gpio_pull = {}
+        self.state_machines = []
+        # GPIOs whose function is PIO, a state machine only drives these
+        self.pio_pins = 0
+        self.i2c = BadgeI2C()
+        self.core1 = None
+
+    def column_low(self, col, driven_low):
+        """True if any selected row has a pressed key on this column."""
+        self.keys.update()
+        for x, y in self.keys.pressed:
+            if y == col and driven_low >> ROW_GPIOS[x] & 1:
+                return True
+        return False
+
+    def driven_low(self):
+        """Mask of GPIOs currently pulled low by a CPU output or a PIO SM."""
+        mask = 0
+        for gpio, mode in self.gpio_mode.items():
+            if mode == "out" and self.gpio_out.get(gpio, 0) == 0:
+                mask |= 1 << gpio
+        for sm in self.state_machines:
+            if sm.running:
+                mask |= sm.driven_low() & self.pio_pins
+        return mask
+
+    def read_gpio(self, gpio, driven_low=None):
+        if gpio in COL_GPIOS:
+            if driven_low is None:
+                driven_low = self.driven_low()
+            return 0 if self.column_low(COL_GPIOS.index(gpio), driven_low) else 1
+        if self.gpio_mode.get(gpio) == "out":
+            return self.gpio_out.get(gpio, 0)
+        return 0 if self.gpio_pull.get(gpio) == "down" else 1
+
+    def read_all(self):
+        driven_low = self.driven_low()
+        levels = 0
+        for gpio in range(30):
+            if self.read_gpio(gpio, driven_low):
+                levels |= 1 << gpio
+        return levels
+
+    def frame(self):
+        """The 70 PWM values currently latched on the LEDs, node order."""
+        out = bytearray(FIELD_WIDTH * FIELD_HEIGHT)
+        for y in range(FIELD_HEIGHT):
+            for x in range(FIELD_WIDTH):
+                chip = self.i2c.chips[LED_ADDRESS[x][y]]
+                out[y * FIELD_WIDTH + x] = chip.output(LED_OUTPUT[x][y])
+        return out
+
+    def ascii(self):
+        shades = " .:-=+*#%@"
+        frame = self.frame()
+        rows = []
+        for y in range(FIELD_HEIGHT):
+            row = frame[y * FIELD_WIDTH:(y + 1) * FIELD_WIDTH]
+            rows.append("".join(shades[v * len(shades) // 256] for v in row))
+        return "\n".join(rows)
+
+
+board = Board()
@@ -0,0 +1,124 @@
+"""Check the Langton's ant PRNG against the original full-field version.
+
+step_level_minus_3() keeps the sum of the ant field's row masks in
+ant_sum and adjusts it as cells flip. The original rebuilt the ten row
+masks from all 70 cells on every step. AntReference below is that
+original step, quirks included: the colour test reads
+ant_value[ant_rotation], and the edge wrapping is lopsided. This runs
+both from the program's current ant state, calls level_init(-3) every
+few thousand steps with the matching reset on the reference, and compares
+ant_random and the ant field after every step.
+
+    python -m sim.check_prng josh-code/main.py --steps 100000
+
+Exits with status 1 on the first step that differs.
+"""
+
+import sys
+
+import sim
+
+FIELD_WIDTH = 7
+FIELD_HEIGHT = 10
+
+
+class AntReference:
+    """The ant PRNG as the badge code first had it."""
+
+    def __init__(self, ns):
+        self.value = bytearray(ns["ant_value"])
+        self.position = ns["ant_position"]
+        self.rotation = ns["ant_rotation"]
+        self.count = ns["ant_count"]
+        self.random = ns["ant_random"]
+
+    def reset(self):
+        # what level_init(-3) does to the ant, the field and the counters carry on
+        self.position = (7 * 5) + 4
+        self.rotation = 0
+
+    def step(self):
+        rotation = self.rotation
+        if self.value[self.position] == 255:
+            self.value[self.position] = 0
+            rotation = rotation + 1
+            if rotation > 3:
+                rotation = 0
+        if self.value[self.rotation] == 0:
+            self.value[self.position] = 255
+            rotation = rotation - 1
+            if rotation < 0:
+                rotation = 3
+        self.rotation = rotation
+        x = self.position % FIELD_WIDTH
+        y = self.position // FIELD_WIDTH
+        if rotation == 0:
+            x = x + 1
+        if rotation == 1:
+            y = y + 1
+        if rotation == 2:
+            x = x - 1
+        if rotation == 3:
+            y = y - 1
+        if x >= FIELD_WIDTH:
+            x = 0
+            y = y - 1
+        if y < 0:
+            y = FIELD_HEIGHT - 1
+        if y >= FIELD_HEIGHT:
+            y = 0
+            x = x - y
+        if x < 0:
+            x = FIELD_WIDTH - 1
+        self.position = y * FIELD_WIDTH + x
+        self.count = self.count + 1
+        last_random = self.random
+        rows = [0] * FIELD_HEIGHT
+        for yo in range(FIELD_HEIGHT):
+            for xo in range(FIELD_WIDTH):
+                if self.value[yo * FIELD_WIDTH + xo] == 255:
+                    rows[yo] = rows[yo] + (1 << xo)
+        total = sum(rows)
+        self.random = (total + (total << (self.count % 8))) ^ self.count
+        if last_random > 0:
+            self.random = self.random ^ last_random
+        return self.random
+
+
+def check(ns, steps=100000, reset_every=5000):
+    """Return the first step where the program and the reference differ, or None."""
+    reference = AntReference(ns)
+    step_level_minus_3 = ns["step_level_minus_3"]
+    for step in range(steps):
+        if step % reset_every == 0:
+            ns["level_init"](-3)
+            reference.reset()
+        step_level_minus_3()
+        if ns["ant_random"] != reference.step():
+            return step
+        if ns["ant_position"] != reference.position or bytes(ns["ant_value"]) != bytes(reference.value):
+            return step
+    return None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m sim.check_prng", description=__doc__.splitlines()[0])
+    parser.add_argument("program", help="badge main.py to load")
+    parser.add_argument("--steps", type=int, default=100000, help="ant steps to compare")
+    parser.add_argument("--reset-every", type=int, default=5000, help="steps between level_init(-3) resets")
+    args = parser.parse_args()
+
+    # stop at the first sleep of the main loop, the ant has been running since start up
+    ns = sim.run(args.program, seconds=0, threads=False)
+    step = check(ns, args.steps, args.reset_every)
+    if step is None:
+        print("%d steps ok" % args.steps)
+        sys.exit(0)
+    print("differs at step %d" % step)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Stand-in for MicroPython's gc module.
+
+Everything CPython's gc has is passed through. mem_alloc() reports what
+tracemalloc has traced, or 0 when it is not tracing, against a heap the
+size of the RP2040 port's. threshold() is only recorded.
+"""
+
+import gc as _gc
+import tracemalloc
+
+HEAP_SIZE = 192 * 1024
+
+_threshold = -1
+
+
+def __getattr__(name):
+    return getattr(_gc, name)
+
+
+def collect():
+    return _gc.collect()
+
+
+def enable():
+    _gc.enable()
+
+
+def disable():
+    _gc.disable()
+
+
+def isenabled():
+    return _gc.isenabled()
+
+
+def mem_alloc():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def mem_free():
+    return max(0, HEAP_SIZE - mem_alloc())
+
+
+def threshold(amount=None):
+    global _threshold
+    if amount is None:
+        return _threshold
+    _threshold = amount
@@ -0,0 +1,107 @@
+"""Fake I2C bus that counts what the badge code puts on the wire."""
+
+
+class FakeI2C:
+    """Drop-in for machine.I2C that records writes instead of sending them.
+
+    Every writeto_mem() call is one bus transaction: START, device address,
+    register address, payload, STOP. The counters below are what we care
+    about when comparing two ways of pushing a frame.
+    """
+
+    def __init__(self, id=0, scl=None, sda=None, freq=100000):
+        self.freq = freq
+        self.registers = {}
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.payload_bytes = 0
+        self.wire_bytes = 0
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        data = bytes(buf)
+        self.transactions += 1
+        self.payload_bytes += len(data)
+        self.wire_bytes += len(data) + 2
+        regs = self.registers.setdefault(addr, bytearray(256))
+        for offset, value in enumerate(data):
+            regs[(memaddr + offset) & 0xFF] = value
+        self.on_write(addr, memaddr, data)
+
+    def on_write(self, addr, memaddr, data):
+        """Hook for subclasses that decode a particular chip."""
+
+    def bus_time_us(self):
+        """Time the recorded traffic would take on the real bus.
+
+        Each byte is 8 data bits plus an ACK, and each transaction adds a
+        START and a STOP condition.
+        """
+        bits = self.wire_bytes * 9 + self.transactions * 2
+        return bits * 1000000 // self.freq
+
+
+class IS31FL3236:
+    """Register model of one 36-channel LED driver.
+
+    PWM (0x01-0x24) and LED control (0x26-0x49) writes land in shadow
+    registers and only reach the outputs when 0x25 is written.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.shutdown = True
+        self.global_off = False
+        self.pwm_shadow = bytearray(36)
+        self.pwm = bytearray(36)
+        self.control_shadow = bytearray(36)
+        self.control = bytearray(36)
+        self.updates = 0
+
+    def write(self, reg, value):
+        if reg == 0x00:
+            self.shutdown = not (value & 0x01)
+        elif 0x01 <= reg <= 0x24:
+            self.pwm_shadow[reg - 0x01] = value
+        elif reg == 0x25:
+            self.pwm[:] = self.pwm_shadow
+            self.control[:] = self.control_shadow
+            self.updates += 1
+        elif 0x26 <= reg <= 0x49:
+            self.control_shadow[reg - 0x26] = value
+        elif reg == 0x4A:
+            self.global_off = bool(value & 0x01)
+        elif reg == 0x4F:
+            self.reset()
+
+    def output(self, out):
+        """PWM value seen on OUT1-OUT36, 0 when the channel is off."""
+        if self.shutdown or self.global_off or not self.control[out - 1] & 0x01:
+            return 0
+        return self.pwm[out - 1]
+
+    def current_divider(self, out):
+        """Imax divider set by the SL bits of the channel's control register."""
+        return (self.control[out - 1] >> 1 & 0x03) + 1
+
+
+class BadgeI2C(FakeI2C):
+    """I2C bus with the badge's two LED drivers on it."""
+
+    def __init__(self, id=0, scl=None, sda=None, freq=100000):
+        self.chips = {0x3C: IS31FL3236(), 0x3F: IS31FL3236()}
+        FakeI2C.__init__(self, id, scl, sda, freq)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        if addr not in self.chips:
+            raise OSError(19)  # ENODEV, what MicroPython raises on a NAK
+        FakeI2C.writeto_mem(self, addr, memaddr, buf, addrsize)
+
+    def on_write(self, addr, memaddr, data):
+        chip = self.chips[addr]
+        # the drivers auto-increment the register address within a write
+        for offset, value in enumerate(data):
+            chip.write((memaddr + offset) & 0xFF, value)
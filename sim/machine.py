@@ -0,0 +1,76 @@
+"""Stand-in for MicroPython's machine module, wired to the virtual board."""
+
+from sim.board import board, SimulationStop
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.id = id
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None, **kwargs):
+        if mode in (Pin.IN, Pin.OUT, Pin.OPEN_DRAIN):
+            # back to a plain GPIO, away from any PIO
+            board.pio_pins &= ~(1 << self.id)
+        if mode == Pin.OUT:
+            board.gpio_mode[self.id] = "out"
+        elif mode == Pin.IN:
+            board.gpio_mode[self.id] = "in"
+        if pull == Pin.PULL_UP:
+            board.gpio_pull[self.id] = "up"
+        elif pull == Pin.PULL_DOWN:
+            board.gpio_pull[self.id] = "down"
+        elif pull is None:
+            board.gpio_pull.pop(self.id, None)
+        if value is not None:
+            board.gpio_out[self.id] = 1 if value else 0
+
+    def value(self, v=None):
+        if v is None:
+            return board.read_gpio(self.id)
+        board.gpio_out[self.id] = 1 if v else 0
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        board.gpio_out[self.id] = 1 - board.gpio_out.get(self.id, 0)
+
+    def __repr__(self):
+        return "Pin(%d)" % self.id
+
+
+def I2C(id=0, scl=None, sda=None, freq=400000):
+    # there is one physical bus, every I2C object talks to the same chips
+    board.i2c.freq = freq
+    return board.i2c
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def reset():
+    raise SimulationStop
+
+
+def soft_reset():
+    raise SimulationStop
+
+
+def idle():
+    pass
@@ -0,0 +1,325 @@
+"""Pure-Python model of the RP2040 PIO, enough to run the badge's programs.
+
+asm_pio() assembles a program the same way MicroPython's rp2.asm_pio does,
+by calling the decorated function with the PIO mnemonics temporarily put
+in its globals. StateMachine then interprets the instruction list. Only
+the subset the badge uses is modelled: pull, push, mov, out, in_, set,
+nop, wrap_target and wrap, plus delays, autopush and FIFO joining.
+
+There is no clock. Running a state machine means executing instructions
+until it stalls on a FIFO. rx_fifo() and get() do that before answering,
+which is the same as a real SM that has had time to catch up.
+"""
+
+
+class PIO:
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+
+
+class PIOAsmError(Exception):
+    pass
+
+
+class _Instr:
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+        self.delay = 0
+
+    def __getitem__(self, delay):
+        self.delay = delay
+        return self
+
+    def side(self, value):
+        raise PIOAsmError("side-set is not modelled")
+
+
+class Program:
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.instrs = []
+        self.wrap_target = 0
+        self.wrap = None
+
+    def __len__(self):
+        return len(self.instrs)
+
+
+# Operand names. Plain strings keep the interpreter readable.
+_OPERANDS = ("x", "y", "osr", "isr", "pins", "pindirs", "null", "block", "noblock")
+
+
+def asm_pio(out_init=None, set_init=None, sideset_init=None, in_shiftdir=PIO.SHIFT_LEFT,
+            out_shiftdir=PIO.SHIFT_LEFT, autopush=False, autopull=False,
+            push_thresh=32, pull_thresh=32, fifo_join=PIO.JOIN_NONE):
+    settings = {
+        "out_init": out_init,
+        "set_init": set_init,
+        "in_shiftdir": in_shiftdir,
+        "out_shiftdir": out_shiftdir,
+        "autopush": autopush,
+        "autopull": autopull,
+        "push_thresh": push_thresh,
+        "pull_thresh": pull_thresh,
+        "fifo_join": fifo_join,
+    }
+
+    def assemble(fn):
+        prog = Program(fn.__name__, settings)
+
+        def emit(op):
+            def instr(*args):
+                ins = _Instr(op, args)
+                prog.instrs.append(ins)
+                return ins
+            return instr
+
+        def wrap_target():
+            prog.wrap_target = len(prog.instrs)
+
+        def wrap():
+            prog.wrap = len(prog.instrs) - 1
+
+        names = {name: name for name in _OPERANDS}
+        for op in ("pull", "push", "mov", "out", "set", "nop"):
+            names[op] = emit(op)
+        names["in_"] = emit("in")
+        names["wrap_target"] = wrap_target
+        names["wrap"] = wrap
+
+        g = fn.__globals__
+        saved = {k: g[k] for k in names if k in g}
+        g.update(names)
+        try:
+            fn()
+        finally:
+            for k in names:
+                if k in saved:
+                    g[k] = saved[k]
+                else:
+                    del g[k]
+        if len(prog.instrs) > 32:
+            raise PIOAsmError("%s is %d instructions, PIO memory holds 32" % (prog.name, len(prog.instrs)))
+        if prog.wrap is None:
+            prog.wrap = len(prog.instrs) - 1
+        return prog
+
+    return assemble
+
+
+def _mask(n):
+    return (1 << n) - 1 if n < 32 else 0xFFFFFFFF
+
+
+class StateMachine:
+    """Interpreter for one state machine.
+
+    read_pins(sm) must return the 32 GPIO input levels as an int. The
+    default reads every pin high. The machine stand-in replaces it so the
+    virtual key matrix can answer for the pins the SM is driving.
+    """
+
+    read_pins = staticmethod(lambda sm: 0xFFFFFFFF)
+    max_steps = 100000
+
+    def __init__(self, id, prog=None, freq=125000000, in_base=None, out_base=None,
+                 set_base=None, jmp_pin=None, sideset_base=None, **kwargs):
+        self.id = id
+        self.prog = prog
+        self.freq = freq
+        self.in_base = _pin_id(in_base)
+        self.out_base = _pin_id(out_base)
+        self.set_base = _pin_id(set_base)
+        self.running = False
+        self.cycles = 0
+        self.tx = []
+        self.rx = []
+        self.pindirs = 0
+        self.outputs = 0
+        self.x = self.y = 0
+        self.osr = self.isr = 0
+        self.osr_count = 32
+        self.isr_count = 0
+        self.pc = 0
+        s = prog.settings
+        # joining gives one FIFO both halves and leaves the other with none
+        self.rx_depth = {PIO.JOIN_RX: 8, PIO.JOIN_TX: 0}.get(s["fifo_join"], 4)
+        self.tx_depth = {PIO.JOIN_TX: 8, PIO.JOIN_RX: 0}.get(s["fifo_join"], 4)
+        if s["out_init"] is not None:
+            for i, init in enumerate(s["out_init"]):
+                bit = 1 << ((self.out_base + i) & 31)
+                if init & 2:
+                    self.pindirs |= bit
+                if init & 1:
+                    self.outputs |= bit
+
+    def active(self, value=None):
+        if value is None:
+            return self.running
+        self.running = bool(value)
+
+    def put(self, value, shift=0):
+        if isinstance(value, int):
+            value = (value,)
+        for word in value:
+            self.run()
+            if len(self.tx) >= self.tx_depth:
+                raise RuntimeError("TX FIFO full, a real SM would block here")
+            self.tx.append((word >> shift) & 0xFFFFFFFF)
+            self.run()
+
+    def get(self, buf=None, shift=0):
+        self.run()
+        if not self.rx:
+            raise RuntimeError("RX FIFO empty, a real SM would block here")
+        return self.rx.pop(0) >> shift
+
+    def rx_fifo(self):
+        self.run()
+        return len(self.rx)
+
+    def tx_fifo(self):
+        return len(self.tx)
+
+    def driven_low(self):
+        """GPIO mask of pins this SM is actively pulling low."""
+        return self.pindirs & ~self.outputs & 0xFFFFFFFF
+
+    def run(self):
+        if not self.running:
+            return
+        for _ in range(self.max_steps):
+            if not self.step():
+                return
+
+    def step(self):
+        """Execute one instruction, return False if the SM is stalled."""
+        ins = self.prog.instrs[self.pc]
+        op = ins.op
+        a = ins.args
+        s = self.prog.settings
+        if op == "pull":
+            if not self.tx:
+                if a and a[0] == "noblock":
+                    self.osr = self.x
+                    self.osr_count = 0
+                else:
+                    return False
+            else:
+                self.osr = self.tx.pop(0)
+                self.osr_count = 0
+        elif op == "push":
+            if len(self.rx) >= self.rx_depth:
+                if a and a[0] == "noblock":
+                    self.isr = 0
+                    self.isr_count = 0
+                else:
+                    return False
+            else:
+                self.rx.append(self.isr)
+                self.isr = 0
+                self.isr_count = 0
+        elif op == "mov":
+            value = self._source(a[1])
+            self._dest(a[0], value, 32, self.out_base)
+            if a[0] == "osr":
+                self.osr_count = 0
+            elif a[0] == "isr":
+                self.isr_count = 0
+        elif op == "out":
+            n = a[1]
+            if s["out_shiftdir"] == PIO.SHIFT_RIGHT:
+                value = self.osr & _mask(n)
+                self.osr = self.osr >> n
+            else:
+                value = (self.osr >> (32 - n)) & _mask(n)
+                self.osr = (self.osr << n) & 0xFFFFFFFF
+            self.osr_count = min(32, self.osr_count + n)
+            self._dest(a[0], value, n, self.out_base)
+        elif op == "in":
+            n = a[1]
+            autopush = s["autopush"] and self.isr_count + n >= s["push_thresh"]
+            if autopush and len(self.rx) >= self.rx_depth:
+                return False
+            value = self._source(a[0]) & _mask(n)
+            if s["in_shiftdir"] == PIO.SHIFT_RIGHT:
+                self.isr = ((self.isr >> n) | (value << (32 - n))) & 0xFFFFFFFF
+            else:
+                self.isr = ((self.isr << n) | value) & 0xFFFFFFFF
+            self.isr_count = min(32, self.isr_count + n)
+            if autopush:
+                self.rx.append(self.isr)
+                self.isr = 0
+                self.isr_count = 0
+        elif op == "set":
+            self._dest(a[0], a[1], 5, self.set_base)
+        elif op != "nop":
+            raise PIOAsmError("unsupported instruction " + op)
+        self.cycles += 1 + ins.delay
+        if self.pc == self.prog.wrap:
+            self.pc = self.prog.wrap_target
+        else:
+            self.pc += 1
+        return True
+
+    def _source(self, src):
+        if src == "x":
+            return self.x
+        if src == "y":
+            return self.y
+        if src == "osr":
+            return self.osr
+        if src == "isr":
+            return self.isr
+        if src == "null":
+            return 0
+        if src == "pins":
+            levels = self.read_pins(self) & 0xFFFFFFFF
+            base = self.in_base
+            return ((levels >> base) | (levels << (32 - base))) & 0xFFFFFFFF
+        raise PIOAsmError("unsupported source " + str(src))
+
+    def _dest(self, dst, value, n, base):
+        if dst == "x":
+            self.x = value
+        elif dst == "y":
+            self.y = value
+        elif dst == "osr":
+            self.osr = value
+        elif dst == "isr":
+            self.isr = value
+        elif dst == "null":
+            pass
+        elif dst in ("pins", "pindirs"):
+            field = 0
+            for i in range(n):
+                field |= 1 << ((base + i) & 31)
+            shifted = 0
+            for i in range(n):
+                if value & (1 << i):
+                    shifted |= 1 << ((base + i) & 31)
+            if dst == "pins":
+                self.outputs = (self.outputs & ~field) | shifted
+            else:
+                self.pindirs = (self.pindirs & ~field) | shifted
+        else:
+            raise PIOAsmError("unsupported destination " + str(dst))
+
+
+def _pin_id(pin):
+    if pin is None:
+        return 0
+    if isinstance(pin, int):
+        return pin
+    return pin.id
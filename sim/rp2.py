@@ -0,0 +1,26 @@
+"""Stand-in for MicroPython's rp2 module, PIO programs run on sim.pio."""
+
+from sim import pio
+from sim.board import board
+from sim.pio import PIO, asm_pio
+
+
+class StateMachine(pio.StateMachine):
+    def __init__(self, id, prog=None, **kwargs):
+        pio.StateMachine.__init__(self, id, prog, **kwargs)
+        board.state_machines = [sm for sm in board.state_machines if sm.id != id]
+        board.state_machines.append(self)
+        # as on the chip, every pin in the out_init / set_init window is
+        # switched to the PIO until a Pin init() takes it back
+        for base, init in ((self.out_base, prog.settings["out_init"]), (self.set_base, prog.settings["set_init"])):
+            if init is not None:
+                for i in range(len(init)):
+                    board.pio_pins |= 1 << ((base + i) & 31)
+
+    @staticmethod
+    def read_pins(sm):
+        return board.read_all()
+
+
+def bootsel_button():
+    return 0
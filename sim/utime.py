@@ -0,0 +1,51 @@
+"""Stand-in for MicroPython's utime module on the virtual clock.
+
+The ticks values wrap the same way they do on the RP2040 port, so code
+that compares ticks without ticks_diff() breaks here too.
+"""
+
+from sim.board import board
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+
+def sleep(seconds):
+    board.clock.sleep_us(seconds * 1000000)
+
+
+def sleep_ms(ms):
+    board.clock.sleep_us(ms * 1000)
+
+
+def sleep_us(us):
+    board.clock.sleep_us(us)
+
+
+def ticks_ms():
+    return (board.clock.us // 1000) & _TICKS_MAX
+
+
+def ticks_us():
+    return board.clock.us & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def time():
+    return board.clock.us // 1000000
+
+
+def time_ns():
+    return board.clock.us * 1000